@@ -69,6 +69,79 @@ OPENROUTER_API_CONFIGS = [
 # Filter out configs with empty keys
 OPENROUTER_API_CONFIGS = [config for config in OPENROUTER_API_CONFIGS if config["key"]]
 
+# ───── Context Window ───── #
+CONVERSATION_HISTORY_LIMIT = int(getenv("CONVERSATION_HISTORY_LIMIT", "10"))  # Messages read per reply
+HISTORY_CACHE_MAX_USERS = int(getenv("HISTORY_CACHE_MAX_USERS", "5000"))  # Users whose recent history stays in memory
+CONVERSATION_BUCKET_SIZE = int(getenv("CONVERSATION_BUCKET_SIZE", "100"))  # Messages stored per bucket document
+CONTEXT_HISTORY_TOKEN_BUDGET = int(getenv("CONTEXT_HISTORY_TOKEN_BUDGET", "600"))  # History tokens sent to OpenRouter
+POLLINATIONS_HISTORY_TOKEN_BUDGET = int(getenv("POLLINATIONS_HISTORY_TOKEN_BUDGET", "150"))  # Kept small, it travels in the URL
+CONVERSATION_SUMMARY_TOKEN_BUDGET = int(getenv("CONVERSATION_SUMMARY_TOKEN_BUDGET", "120"))  # Size of the rolling summary
+
+# ───── Long-Term Memory ───── #
+MEMORY_ENABLED = getenv("MEMORY_ENABLED", "true").lower() == "true"
+MEMORY_INDEX_DIR = getenv("MEMORY_INDEX_DIR", "data/memory")  # Append-only per-user index files
+MEMORY_INDEX_DIM = int(getenv("MEMORY_INDEX_DIM", "256"))  # Hashed feature dimensions (changing it needs a rebuild)
+MEMORY_INDEX_MAX_ENTRIES = int(getenv("MEMORY_INDEX_MAX_ENTRIES", "2000"))  # Snippets kept per user
+MEMORY_INDEX_MAX_USERS = int(getenv("MEMORY_INDEX_MAX_USERS", "200"))  # User indexes kept in RAM
+MEMORY_TOP_K = int(getenv("MEMORY_TOP_K", "3"))  # Old snippets added to each prompt
+MEMORY_MIN_SCORE = float(getenv("MEMORY_MIN_SCORE", "0.15"))  # Cosine similarity needed to recall a snippet
+MEMORY_MIN_WORDS = int(getenv("MEMORY_MIN_WORDS", "4"))  # Shorter user messages are not remembered
+MEMORY_SNIPPET_LENGTH = int(getenv("MEMORY_SNIPPET_LENGTH", "160"))
+
+# ───── Chat Message Coalescing ───── #
+CHAT_COALESCE_WINDOW = float(getenv("CHAT_COALESCE_WINDOW", "1.2"))  # Quiet seconds that close a burst (0 disables)
+CHAT_COALESCE_MAX_WAIT = float(getenv("CHAT_COALESCE_MAX_WAIT", "4"))  # Max seconds a burst is held open
+CHAT_COALESCE_MAX_MESSAGES = int(getenv("CHAT_COALESCE_MAX_MESSAGES", "6"))
+
+# ───── Response Cache ───── #
+RESPONSE_CACHE_MAX_ENTRIES = int(getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_TTL = int(getenv("RESPONSE_CACHE_TTL", "21600"))  # Seconds a reply pool stays valid
+RESPONSE_CACHE_POOL_SIZE = int(getenv("RESPONSE_CACHE_POOL_SIZE", "4"))  # Varied replies kept per message
+RESPONSE_CACHE_MAX_MESSAGE_LENGTH = int(getenv("RESPONSE_CACHE_MAX_MESSAGE_LENGTH", "30"))  # Only short messages are cached
+
+# ───── LLM Work Queue ───── #
+LLM_MAX_CONCURRENCY = int(getenv("LLM_MAX_CONCURRENCY", "16"))  # Replies generated at once
+LLM_QUEUE_MAX_SIZE = int(getenv("LLM_QUEUE_MAX_SIZE", "100"))  # Waiting replies before new ones are shed
+LLM_QUEUE_MAX_WAIT = float(getenv("LLM_QUEUE_MAX_WAIT", "5"))  # Seconds a reply may wait for a slot before it is shed
+
+# ───── Response Latency Budget ───── #
+AI_RESPONSE_DEADLINE = float(getenv("AI_RESPONSE_DEADLINE", "12"))  # Max seconds per message before the canned fallback
+AI_FALLBACK_RESERVE = float(getenv("AI_FALLBACK_RESERVE", "3"))  # Seconds of the budget kept for Pollinations.ai
+
+# ───── OpenRouter Hedging ───── #
+OPENROUTER_HEDGING_ENABLED = getenv("OPENROUTER_HEDGING_ENABLED", "true").lower() == "true"
+OPENROUTER_HEDGE_DELAY = float(getenv("OPENROUTER_HEDGE_DELAY", "4"))  # Used until enough latency samples exist
+OPENROUTER_HEDGE_DELAY_MIN = float(getenv("OPENROUTER_HEDGE_DELAY_MIN", "1"))
+OPENROUTER_HEDGE_DELAY_MAX = float(getenv("OPENROUTER_HEDGE_DELAY_MAX", "10"))
+OPENROUTER_HEDGE_PERCENTILE = float(getenv("OPENROUTER_HEDGE_PERCENTILE", "95"))
+OPENROUTER_HEDGE_MIN_SAMPLES = int(getenv("OPENROUTER_HEDGE_MIN_SAMPLES", "20"))
+OPENROUTER_HEDGE_MAX_PARALLEL = int(getenv("OPENROUTER_HEDGE_MAX_PARALLEL", "2"))  # Max configs in flight at once
+
+# ───── Provider Health / Circuit Breaker ───── #
+PROVIDER_HEALTH_EWMA_ALPHA = float(getenv("PROVIDER_HEALTH_EWMA_ALPHA", "0.3"))  # Weight of the newest sample
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "3"))  # Consecutive failures before opening
+CIRCUIT_BREAKER_ERROR_RATE = float(getenv("CIRCUIT_BREAKER_ERROR_RATE", "0.6"))  # EWMA error rate that opens the circuit
+CIRCUIT_BREAKER_COOLDOWN = int(getenv("CIRCUIT_BREAKER_COOLDOWN", "60"))  # Seconds before a probe is allowed
+CIRCUIT_BREAKER_AUTH_COOLDOWN = int(getenv("CIRCUIT_BREAKER_AUTH_COOLDOWN", "900"))  # Seconds to park a key after a 401
+
+# ───── OpenRouter Rate Limiting ───── #
+OPENROUTER_KEY_RATE_LIMIT = int(getenv("OPENROUTER_KEY_RATE_LIMIT", "20"))  # Requests allowed per key per period (free tier)
+OPENROUTER_KEY_RATE_PERIOD = float(getenv("OPENROUTER_KEY_RATE_PERIOD", "60"))  # Seconds
+OPENROUTER_RATE_LIMIT_MAX_WAIT = float(getenv("OPENROUTER_RATE_LIMIT_MAX_WAIT", "2"))  # Max seconds to queue for a key before spilling to Pollinations
+OPENROUTER_RATE_LIMIT_DEFAULT_BLOCK = float(getenv("OPENROUTER_RATE_LIMIT_DEFAULT_BLOCK", "10"))  # Block after a 429 without Retry-After
+
+# ───── Streaming Replies ───── #
+OPENROUTER_STREAMING_ENABLED = getenv("OPENROUTER_STREAMING_ENABLED", "true").lower() == "true"
+OPENROUTER_STREAM_FIRST_TOKEN_TIMEOUT = float(getenv("OPENROUTER_STREAM_FIRST_TOKEN_TIMEOUT", "8"))  # Seconds before trying the next config
+OPENROUTER_STREAM_READ_TIMEOUT = float(getenv("OPENROUTER_STREAM_READ_TIMEOUT", "15"))  # Max gap between chunks once a reply is streaming
+OPENROUTER_STREAM_ALLOWANCE = float(getenv("OPENROUTER_STREAM_ALLOWANCE", "30"))  # Seconds a started stream may run past the reply budget
+STREAM_EDIT_INTERVAL = float(getenv("STREAM_EDIT_INTERVAL", "1.0"))  # Min seconds between Telegram message edits
+STREAM_FIRST_CHUNK_MIN_CHARS = int(getenv("STREAM_FIRST_CHUNK_MIN_CHARS", "12"))  # Chars to collect before the first send
+
+# ───── AI HTTP Client Settings ───── #
+AI_HTTP_POOL_SIZE = int(getenv("AI_HTTP_POOL_SIZE", "50"))  # Max open connections in the shared session
+AI_HTTP_KEEPALIVE_TIMEOUT = int(getenv("AI_HTTP_KEEPALIVE_TIMEOUT", "60"))  # Seconds to keep idle connections
+
 # ───── Pollinations.ai Text Generation Configuration ───── #
 POLLINATIONS_TEXT_MODELS = [
     {
@@ -82,11 +155,50 @@ As Mila, respond warmly and flirty in 1-2 short sentences under 30 words. Use cu
     }
 ]
 
+POLLINATIONS_DEADLINE = float(getenv("POLLINATIONS_DEADLINE", "20"))  # Overall seconds for the whole Pollinations fallback
+POLLINATIONS_RACE_STAGGER = float(getenv("POLLINATIONS_RACE_STAGGER", "1.5"))  # Head start for the last known-good format
+
 # ───── Mongo & Logging ───── #
 MONGO_DB_URI = getenv("MONGO_DB_URI", "")
 MONGO_DB_NAME = getenv("MONGO_DB_NAME", "MILAAI")
+MONGO_MAX_POOL_SIZE = int(getenv("MONGO_MAX_POOL_SIZE", "50"))  # Upper bound on sockets to each server
+MONGO_MIN_POOL_SIZE = int(getenv("MONGO_MIN_POOL_SIZE", "5"))  # Sockets kept open (and warmed at startup)
+MONGO_MAX_IDLE_TIME_MS = int(getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))  # Idle sockets above the minimum are closed after this
+MONGO_CONNECT_TIMEOUT_MS = int(getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
 LOGGER_ID = int(getenv("LOGGER_ID", "0"))
 
+# ───── Write-Behind Buffer ───── #
+WRITE_BEHIND_ENABLED = getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_FLUSH_INTERVAL = float(getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))  # Seconds between flushes
+WRITE_BEHIND_MAX_BATCH = int(getenv("WRITE_BEHIND_MAX_BATCH", "200"))  # Pending writes that trigger an early flush
+
+# ───── Stats Materializer ───── #
+STATS_MATERIALIZE_INTERVAL = int(getenv("STATS_MATERIALIZE_INTERVAL", "60"))  # Seconds between dashboard snapshot refreshes
+ACTIVE_USERS_HLL_ERROR = float(getenv("ACTIVE_USERS_HLL_ERROR", "0.01"))  # Target standard error of active-user counts
+ACTIVE_USERS_SKETCH_FLUSH_INTERVAL = int(getenv("ACTIVE_USERS_SKETCH_FLUSH_INTERVAL", "60"))  # Seconds between sketch writes
+ACTIVE_USERS_EXACT = getenv("ACTIVE_USERS_EXACT", "false").lower() == "true"  # Count from raw conversations (audits)
+
+# ───── Retention & Archival ───── #
+CONVERSATION_RETENTION_DAYS = int(getenv("CONVERSATION_RETENTION_DAYS", "90"))  # Days conversations stay in MongoDB (0 = forever)
+IMAGE_RETENTION_DAYS = int(getenv("IMAGE_RETENTION_DAYS", "90"))  # Days image generation records stay in MongoDB (0 = forever)
+REMINDER_RETENTION_DAYS = int(getenv("REMINDER_RETENTION_DAYS", "30"))  # Days reminder records stay in MongoDB (0 = forever)
+RETENTION_GRACE_DAYS = int(getenv("RETENTION_GRACE_DAYS", "7"))  # Extra days before TTL deletes data the archiver missed
+ARCHIVE_ENABLED = getenv("ARCHIVE_ENABLED", "true").lower() == "true"  # Copy expiring data to local archive files
+ARCHIVE_DIR = getenv("ARCHIVE_DIR", "data/archive")  # Monthly compressed JSONL files, one folder per collection
+ARCHIVE_INTERVAL = int(getenv("ARCHIVE_INTERVAL", "3600"))  # Seconds between archiver runs
+ARCHIVE_BATCH_SIZE = int(getenv("ARCHIVE_BATCH_SIZE", "500"))  # Documents appended per compressed frame
+
+# ───── User State Cache ───── #
+USER_STATE_CACHE_TTL = int(getenv("USER_STATE_CACHE_TTL", "300"))  # Seconds a cached verification/preferences/reminder flag is trusted
+USER_STATE_CACHE_MAX_USERS = int(getenv("USER_STATE_CACHE_MAX_USERS", "10000"))  # Users whose state stays in memory
+LAST_ACTIVITY_FLUSH_INTERVAL = int(getenv("LAST_ACTIVITY_FLUSH_INTERVAL", "60"))  # At most one last_activity write per user per interval
+
+# ───── History Reaper ───── #
+HISTORY_REAPER_INTERVAL = int(getenv("HISTORY_REAPER_INTERVAL", "300"))  # Seconds between passes over cleared histories
+HISTORY_REAPER_BATCH_SIZE = int(getenv("HISTORY_REAPER_BATCH_SIZE", "50"))  # Bucket documents deleted per batch
+HISTORY_REAPER_BATCH_DELAY = float(getenv("HISTORY_REAPER_BATCH_DELAY", "0.5"))  # Pause between batches to spare the primary
+
 # ───── Notification Settings ───── #
 NOTIFICATION_CHANNEL = getenv("NOTIFICATION_CHANNEL", "@XPTOOLSLOGS")  # Add your channel ID here (e.g., -1001234567890)
 SUPPORT_GROUP_URL = getenv("SUPPORT_GROUP_URL", "https://t.me/Free_Vpn_Chats")  # For notification buttons
@@ -202,6 +314,7 @@ REMINDER_CHECK_INTERVAL = int(getenv("REMINDER_CHECK_INTERVAL", "3600"))
 REMINDER_INACTIVITY_THRESHOLD = int(getenv("REMINDER_INACTIVITY_THRESHOLD", "3600"))
 REMINDER_DELETE_AFTER = int(getenv("REMINDER_DELETE_AFTER", "86400"))
 REMINDER_COOLDOWN = int(getenv("REMINDER_COOLDOWN", "86400"))
+REMINDER_BATCH_SIZE = int(getenv("REMINDER_BATCH_SIZE", "200"))  # Eligible users fetched per cursor batch
 
 REMINDER_MESSAGES = [
     {
@@ -1,17 +1,75 @@
-import requests
+import aiohttp
+import asyncio
 import json
 import logging
-from typing import List, Dict
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
 from config import (
     OPENROUTER_API_CONFIGS, 
     GIRLFRIEND_SYSTEM_PROMPT,
     OPENROUTER_BASE_URL,
     POLLINATIONS_TEXT_BASE_URL,
-    POLLINATIONS_TEXT_MODELS
+    POLLINATIONS_TEXT_MODELS,
+    AI_HTTP_POOL_SIZE,
+    AI_HTTP_KEEPALIVE_TIMEOUT,
+    OPENROUTER_HEDGING_ENABLED,
+    OPENROUTER_HEDGE_DELAY,
+    OPENROUTER_HEDGE_DELAY_MIN,
+    OPENROUTER_HEDGE_DELAY_MAX,
+    OPENROUTER_HEDGE_PERCENTILE,
+    OPENROUTER_HEDGE_MIN_SAMPLES,
+    OPENROUTER_HEDGE_MAX_PARALLEL,
+    OPENROUTER_KEY_RATE_LIMIT,
+    OPENROUTER_KEY_RATE_PERIOD,
+    OPENROUTER_RATE_LIMIT_MAX_WAIT,
+    OPENROUTER_RATE_LIMIT_DEFAULT_BLOCK,
+    OPENROUTER_STREAM_FIRST_TOKEN_TIMEOUT,
+    OPENROUTER_STREAM_READ_TIMEOUT,
+    OPENROUTER_STREAM_ALLOWANCE,
+    POLLINATIONS_DEADLINE,
+    POLLINATIONS_RACE_STAGGER,
+    AI_RESPONSE_DEADLINE,
+    AI_FALLBACK_RESERVE
 )
 import time
 import random
 from loguru import logger
+from core.provider_health import ProviderHealth
+from core.rate_limiter import TokenBucket
+from core.context_window import context_window, SUMMARY_ROLE
+
+FALLBACK_RESPONSES = [
+    "Oh darling, I'm feeling a bit shy right now! Can we chat again in a moment? 😘💕",
+    "My heart's racing too fast to think clearly! Give me a sec, sweetie? 💖✨",
+    "I'm blushing so hard I can't find the right words! Let's try again? 😊💝",
+    "You make me so flustered I can't respond properly! One more time, love? 💗🌹",
+    "Hmm, I'm having trouble finding the perfect words for you right now! Can we try again? 😔💕",
+    "My mind went blank thinking about you! Let me gather my thoughts and try again? 💖😊"
+]
+
+# Shared keep-alive HTTP session for all AI requests
+_http_session: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Get the shared HTTP session, creating it on first use inside the running loop."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=AI_HTTP_POOL_SIZE,
+            keepalive_timeout=AI_HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+        _http_session = aiohttp.ClientSession(connector=connector)
+        logger.debug(f"🌐 Created shared AI HTTP session (pool size: {AI_HTTP_POOL_SIZE})")
+    return _http_session
+
+async def close_http_session():
+    """Close the shared HTTP session on shutdown"""
+    global _http_session
+    if _http_session and not _http_session.closed:
+        await _http_session.close()
+        logger.info("🌐 AI HTTP session closed")
+    _http_session = None
 
 class VeniceAI:
     def __init__(self):
@@ -19,6 +77,7 @@ class VeniceAI:
         self.pollinations_text_url = POLLINATIONS_TEXT_BASE_URL
         self.api_configs = OPENROUTER_API_CONFIGS
         self.pollinations_models = POLLINATIONS_TEXT_MODELS
+        self.pollinations_format = "post"  # Request format that answered last
         
         if not self.api_configs:
             logger.error("❌ No valid OpenRouter API configurations provided")
@@ -38,25 +97,43 @@ class VeniceAI:
         
         self.api_configs = valid_configs
         self.current_config_index = 0
+        self.latency_samples = deque(maxlen=200)  # Recent successful OpenRouter latencies (seconds)
+        self.health = [
+            ProviderHealth(f"config {i + 1} ({config['model']})")
+            for i, config in enumerate(self.api_configs)
+        ]
+        self.rate_limiters = [
+            TokenBucket(f"config {i + 1}", OPENROUTER_KEY_RATE_LIMIT, OPENROUTER_KEY_RATE_PERIOD)
+            for i in range(len(self.api_configs))
+        ]
         self.max_retries = len(self.api_configs) + 1  # +1 for Pollinations.ai fallback
         
         logger.info(f"✅ AI Client initialized with {len(self.api_configs)} OpenRouter configs + Pollinations.ai fallback")
 
-    def _get_openrouter_headers(self):
+    def _get_openrouter_headers(self, config_index: int = None):
         """Get headers with the current API key."""
-        current_config = self.api_configs[self.current_config_index]
+        if config_index is None:
+            config_index = self.current_config_index
+        current_config = self.api_configs[config_index]
         return {
             "Authorization": f"Bearer {current_config['key']}",
             "Content-Type": "application/json",
             "X-Title": "AI Girlfriend Bot"
         }
 
-    def prepare_openrouter_payload(self, prompt: List[Dict], user_message: str, user_first_name: str = None):
+    def prepare_openrouter_payload(self, prompt: List[Dict], user_message: str, user_first_name: str = None, config_index: int = None):
         """Prepare payload for OpenRouter API"""
-        system_prompt = GIRLFRIEND_SYSTEM_PROMPT.format(user_name=user_first_name or 'darling')
-        current_prompt = [{"role": "system", "content": system_prompt}] + prompt + [{"role": "user", "content": user_message}]
+        if config_index is None:
+            config_index = self.current_config_index
+        current_config = self.api_configs[config_index]
+        
+        # Fit the history (and any rolling summary) into this model's token budget
+        packed_history, dropped = context_window.pack(prompt, current_config["model"])
+        if dropped:
+            logger.debug(f"✂️ Dropped {len(dropped)} old turns to fit {current_config['model']} context budget")
         
-        current_config = self.api_configs[self.current_config_index]
+        system_prompt = GIRLFRIEND_SYSTEM_PROMPT.format(user_name=user_first_name or 'darling')
+        current_prompt = [{"role": "system", "content": system_prompt}] + packed_history + [{"role": "user", "content": user_message}]
         payload = {
             "model": current_config["model"],
             "messages": current_prompt,
@@ -89,178 +166,474 @@ class VeniceAI:
         if not conversation_history:
             return "This is our first conversation. Be warm and welcoming."
         
-        # Take only the last 2-3 exchanges to avoid prompt being too long
-        recent_history = conversation_history[-6:] if len(conversation_history) > 6 else conversation_history
+        # The prompt travels in the URL, so it gets a much smaller token budget
+        recent_history, _ = context_window.pack(conversation_history, "pollinations")
         
         formatted_history = []
         for msg in recent_history:
+            if msg["role"] == SUMMARY_ROLE:
+                formatted_history.append(msg["content"])
+                continue
             role = "You" if msg["role"] == "user" else "Mila"
-            content = msg["content"][:80]  # Limit content length
-            formatted_history.append(f"{role}: {content}")
+            formatted_history.append(f"{role}: {msg['content']}")
         
         history_text = " | ".join(formatted_history)
         logger.debug(f"📝 Formatted conversation history: {history_text[:100]}...")
         return history_text
 
-    def get_ai_response(self, conversation_history: List[Dict], user_message: str, user_first_name: str = None) -> str:
-        """Get AI response with fallback between OpenRouter and Pollinations.ai"""
+    async def get_ai_response(self, conversation_history: List[Dict], user_message: str, user_first_name: str = None, deadline: float = None) -> str:
+        """Get AI response with fallback between OpenRouter and Pollinations.ai, within the response deadline"""
         logger.info(f"🎯 Getting AI response for user {user_first_name or 'Unknown'}, message: '{user_message[:50]}...'")
+        # Callers pass the deadline taken when the message arrived, so queueing counts against the budget
+        if deadline is None:
+            deadline = time.monotonic() + AI_RESPONSE_DEADLINE
         
-        # Try OpenRouter first
-        openrouter_response = self._try_openrouter(conversation_history, user_message, user_first_name)
+        try:
+            return await asyncio.wait_for(
+                self._get_ai_response(conversation_history, user_message, user_first_name, deadline),
+                timeout=self._remaining(deadline)
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ No AI response within the {AI_RESPONSE_DEADLINE}s budget, using fallback response")
+            return self.get_fallback_response()
+
+    async def _get_ai_response(self, conversation_history: List[Dict], user_message: str, user_first_name: str, deadline: float) -> str:
+        """Provider chain behind get_ai_response; every attempt only gets the time left before the deadline"""
+        # Try OpenRouter first, leaving room for the Pollinations.ai fallback
+        openrouter_response = await self._try_openrouter(conversation_history, user_message, user_first_name, deadline - AI_FALLBACK_RESERVE)
         if openrouter_response:
             logger.success("✅ OpenRouter response successful")
             return openrouter_response
         
         # If OpenRouter fails, try Pollinations.ai WITH conversation history
         logger.warning("🔄 OpenRouter failed, trying Pollinations.ai...")
-        pollinations_response = self._try_pollinations(conversation_history, user_message, user_first_name)
+        pollinations_response = await self._try_pollinations(conversation_history, user_message, user_first_name, deadline)
         if pollinations_response:
             logger.success("✅ Pollinations.ai response successful")
             return pollinations_response
         
         # If both fail, return fallback message
         logger.error("💥 All AI services failed, using fallback response")
-        return self._get_fallback_response()
+        return self.get_fallback_response()
 
-    def _try_openrouter(self, conversation_history: List[Dict], user_message: str, user_first_name: str = None) -> str:
-        """Try to get response from OpenRouter with comprehensive error handling"""
-        original_config_index = self.current_config_index
-        retries = 0
+    async def stream_ai_response(self, conversation_history: List[Dict], user_message: str, user_first_name: str = None, deadline: float = None) -> AsyncIterator[str]:
+        """Stream the reply as growing, cleaned text snapshots, falling back like get_ai_response"""
+        logger.info(f"🎯 Streaming AI response for user {user_first_name or 'Unknown'}, message: '{user_message[:50]}...'")
+        # The budget covers time to first visible text; a reply that is already streaming is left to finish
+        if deadline is None:
+            deadline = time.monotonic() + AI_RESPONSE_DEADLINE
+        
+        config_order = self._route_configs()
+        for config_index in config_order:
+            if self._remaining(deadline - AI_FALLBACK_RESERVE) <= 0:
+                break
+            produced = False
+            async for text in self._stream_openrouter(config_index, conversation_history, user_message, user_first_name, deadline - AI_FALLBACK_RESERVE):
+                produced = True
+                yield text
+            if produced:
+                return
+        
+        # Nothing streamed, fall back to a complete Pollinations.ai answer
+        logger.warning("🔄 OpenRouter streaming failed, trying Pollinations.ai...")
+        pollinations_response = await self._try_pollinations(conversation_history, user_message, user_first_name, deadline)
+        if pollinations_response:
+            logger.success("✅ Pollinations.ai response successful")
+            yield pollinations_response
+            return
+        
+        logger.error("💥 All AI services failed, using fallback response")
+        yield self.get_fallback_response()
+
+    async def _stream_openrouter(self, config_index: int, conversation_history: List[Dict], user_message: str, user_first_name: str, deadline: float) -> AsyncIterator[str]:
+        """Stream one OpenRouter completion over SSE; yields nothing if the config fails before the first token"""
+        first_token_timeout = min(OPENROUTER_STREAM_FIRST_TOKEN_TIMEOUT, self._remaining(deadline))
+        current_config = self.api_configs[config_index]
+        health = self.health[config_index]
+        limiter = self.rate_limiters[config_index]
+        if not limiter.try_acquire():
+            return
+        if not health.begin_attempt():
+            limiter.refund()
+            return
         
-        logger.info(f"🔄 Starting OpenRouter attempt with {len(self.api_configs)} configs")
+        session = get_http_session()
+        started = time.monotonic()
+        raw_text = ""
         
-        while retries < len(self.api_configs):
-            current_config = self.api_configs[self.current_config_index]
-            logger.debug(f"🔄 Attempt {retries + 1}/{len(self.api_configs)} with config {self.current_config_index + 1} (model: {current_config['model']})")
+        try:
+            payload = self.prepare_openrouter_payload(conversation_history, user_message, user_first_name, config_index)
+            payload["stream"] = True
             
-            try:
-                payload = self.prepare_openrouter_payload(conversation_history, user_message, user_first_name)
+            # Connecting, waiting for headers and the first token all count against the first-token deadline
+            first_token_deadline = started + first_token_timeout
+            response = await asyncio.wait_for(session.post(
+                self.openrouter_url,
+                headers=self._get_openrouter_headers(config_index),
+                json=payload,
+                # sock_read guards every gap between chunks once streaming, so it stays fixed
+                timeout=aiohttp.ClientTimeout(
+                    total=self._remaining(deadline) + OPENROUTER_STREAM_ALLOWANCE,
+                    sock_read=OPENROUTER_STREAM_READ_TIMEOUT
+                )
+            ), self._remaining(first_token_deadline))
+            async with response:
+                limiter.update_from_headers(response.headers, response.status, OPENROUTER_RATE_LIMIT_DEFAULT_BLOCK)
+                
+                if response.status == 429:
+                    logger.warning(f"⏰ Rate limit hit for config {config_index + 1} (model: {current_config['model']})")
+                    health.abort_attempt()
+                    return
+                if response.status != 200:
+                    logger.error(f"❌ OpenRouter stream error {response.status} for config {config_index + 1}: {await response.text()}")
+                    health.record_failure(fatal=response.status == 401)
+                    return
                 
-                response = requests.post(
-                    self.openrouter_url,
-                    headers=self._get_openrouter_headers(),
-                    json=payload,
-                    timeout=25
+                while True:
+                    if raw_text:
+                        line = await response.content.readline()
+                    else:
+                        line = await asyncio.wait_for(response.content.readline(), self._remaining(first_token_deadline))
+                    if not line:
+                        break
+                    line = line.decode('utf-8', errors='ignore').strip()
+                    # Skip blank lines and SSE comments such as ": OPENROUTER PROCESSING"
+                    if not line.startswith("data:"):
+                        continue
+                    
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    choices = json.loads(data).get("choices") or []
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+                    if not delta:
+                        continue
+                    
+                    if not raw_text:
+                        logger.info(f"⚡ First token from config {config_index + 1} after {time.monotonic() - started:.2f}s")
+                    raw_text += delta
+                    cleaned = self._clean_response(raw_text)
+                    if cleaned:
+                        yield cleaned
+            
+            if self._clean_response(raw_text):
+                latency = time.monotonic() - started
+                self.latency_samples.append(latency)
+                health.record_success(latency)
+                self.current_config_index = config_index
+                logger.success(f"✅ OpenRouter stream complete with config {config_index + 1} (model: {current_config['model']})")
+            else:
+                logger.warning(f"⚠️ Empty stream from OpenRouter config {config_index + 1}")
+                health.record_failure()
+                
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ OpenRouter stream timeout with config {config_index + 1} (model: {current_config['model']})")
+            health.record_failure()
+        except aiohttp.ClientConnectionError:
+            logger.error(f"🔌 OpenRouter stream connection error with config {config_index + 1} (model: {current_config['model']})")
+            health.record_failure()
+        except (GeneratorExit, asyncio.CancelledError):
+            # Consumer stopped reading, the provider itself did nothing wrong
+            health.abort_attempt()
+            raise
+        except Exception as e:
+            logger.error(f"💥 OpenRouter stream unexpected error with config {config_index + 1} (model: {current_config['model']}): {e}")
+            health.record_failure()
+
+    async def _try_openrouter(self, conversation_history: List[Dict], user_message: str, user_first_name: str = None, deadline: float = None) -> str:
+        """Try to get response from OpenRouter with comprehensive error handling"""
+        if deadline is None:
+            deadline = time.monotonic() + AI_RESPONSE_DEADLINE
+        
+        config_order = self._route_configs()
+        if not config_order:
+            wait = self._time_until_budget()
+            if wait is None:
+                logger.warning("🚧 Every OpenRouter config has an open circuit, skipping OpenRouter")
+                return None
+            if wait > min(OPENROUTER_RATE_LIMIT_MAX_WAIT, self._remaining(deadline)):
+                logger.warning(f"⏳ Every OpenRouter key is out of budget for {wait:.1f}s, spilling to Pollinations.ai")
+                return None
+            
+            # A key frees up soon enough to be worth queueing for
+            logger.info(f"⏳ Every OpenRouter key is out of budget, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+            config_order = self._route_configs()
+            if not config_order:
+                return None
+        
+        logger.info(f"🔄 Starting OpenRouter attempt with {len(config_order)}/{len(self.api_configs)} healthy configs")
+        
+        if OPENROUTER_HEDGING_ENABLED and len(config_order) > 1:
+            response = await self._try_openrouter_hedged(config_order, conversation_history, user_message, user_first_name, deadline)
+        else:
+            response = await self._try_openrouter_sequential(config_order, conversation_history, user_message, user_first_name, deadline)
+        
+        if not response:
+            logger.error(f"💥 All {len(config_order)} routed OpenRouter configs failed")
+        return response
+
+    def _route_configs(self) -> List[int]:
+        """Healthy configs with budget left, fastest first; open circuits and exhausted keys are skipped"""
+        available = [
+            i for i, health in enumerate(self.health)
+            if health.can_attempt() and self.rate_limiters[i].has_budget()
+        ]
+        # Stable sort keeps the last working config ahead of equally scored ones
+        available.sort(key=lambda i: (self.health[i].score(), (i - self.current_config_index) % len(self.api_configs)))
+        return available
+
+    def _time_until_budget(self) -> Optional[float]:
+        """Seconds until any healthy key has budget again, or None if every circuit is open"""
+        waits = [
+            self.rate_limiters[i].time_until_available()
+            for i, health in enumerate(self.health)
+            if health.can_attempt()
+        ]
+        return min(waits) if waits else None
+
+    def _remaining(self, deadline: float) -> float:
+        """Seconds left before the deadline"""
+        return max(0.0, deadline - time.monotonic())
+
+    async def _try_openrouter_sequential(self, config_order: List[int], conversation_history: List[Dict], user_message: str, user_first_name: str, deadline: float) -> str:
+        """Walk the routed configs one at a time, backing off between failed attempts"""
+        for attempt, config_index in enumerate(config_order):
+            if self._remaining(deadline) <= 0:
+                logger.warning("⏰ OpenRouter budget spent, stopping config walk")
+                break
+            logger.debug(f"🔄 Attempt {attempt + 1}/{len(config_order)} with config {config_index + 1} (model: {self.api_configs[config_index]['model']})")
+            response, backoff = await self._request_openrouter(config_index, conversation_history, user_message, user_first_name, deadline)
+            if response:
+                return response
+            
+            if attempt < len(config_order) - 1:
+                await asyncio.sleep(min(backoff, self._remaining(deadline)))
+        
+        return None
+
+    async def _try_openrouter_hedged(self, config_order: List[int], conversation_history: List[Dict], user_message: str, user_first_name: str, deadline: float) -> str:
+        """Fire the next config whenever the in-flight ones are slower than the hedge delay"""
+        hedge_delay = self._get_hedge_delay()
+        logger.debug(f"🏁 Hedged OpenRouter request, hedge delay {hedge_delay:.2f}s")
+        
+        async def attempt(config_index: int) -> Optional[str]:
+            response, _ = await self._request_openrouter(config_index, conversation_history, user_message, user_first_name, deadline)
+            return response
+        
+        return await self._race(
+            [lambda i=i: attempt(i) for i in config_order],
+            hedge_delay,
+            OPENROUTER_HEDGE_MAX_PARALLEL
+        )
+
+    async def _race(self, attempts: List[Callable[[], Awaitable[Optional[str]]]], hedge_delay: float, max_parallel: int) -> Optional[str]:
+        """Run attempts staggered by hedge_delay, return the first good answer and cancel the rest"""
+        remaining = iter(attempts)
+        pending = set()
+        
+        def launch() -> bool:
+            factory = next(remaining, None)
+            if factory is None:
+                return False
+            pending.add(asyncio.ensure_future(factory()))
+            return True
+        
+        launch()
+        exhausted = False
+        try:
+            while pending:
+                can_hedge = not exhausted and len(pending) < max_parallel
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
                 )
                 
-                # Handle rate limits
-                if response.status_code == 429:
-                    logger.warning(f"⏰ Rate limit hit for config {self.current_config_index + 1} (model: {current_config['model']})")
-                    self._rotate_config()
-                    retries += 1
-                    time.sleep(1.5)
+                if not done:
+                    # Nobody answered within the hedge delay, fire the next config alongside
+                    exhausted = not launch()
                     continue
                 
+                for task in done:
+                    pending.discard(task)
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        return task.result()
+                    # A failed attempt is replaced straight away
+                    if not exhausted:
+                        exhausted = not launch()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _get_hedge_delay(self) -> float:
+        """Hedge delay from the observed latency percentile, or the configured default while warming up"""
+        if len(self.latency_samples) < OPENROUTER_HEDGE_MIN_SAMPLES:
+            return OPENROUTER_HEDGE_DELAY
+        
+        samples = sorted(self.latency_samples)
+        rank = min(len(samples) - 1, int(len(samples) * OPENROUTER_HEDGE_PERCENTILE / 100))
+        return min(OPENROUTER_HEDGE_DELAY_MAX, max(OPENROUTER_HEDGE_DELAY_MIN, samples[rank]))
+
+    async def _request_openrouter(self, config_index: int, conversation_history: List[Dict], user_message: str, user_first_name: str, deadline: float) -> Tuple[Optional[str], float]:
+        """Make a single OpenRouter request, returning the response and the backoff to apply on failure"""
+        current_config = self.api_configs[config_index]
+        timeout = min(25, self._remaining(deadline))
+        if timeout <= 0:
+            return None, 0
+        health = self.health[config_index]
+        limiter = self.rate_limiters[config_index]
+        if not limiter.try_acquire():
+            logger.debug(f"⏳ Skipping config {config_index + 1}, no rate-limit budget left")
+            return None, 0
+        if not health.begin_attempt():
+            limiter.refund()
+            logger.debug(f"🚧 Skipping config {config_index + 1}, a recovery probe is already running")
+            return None, 0
+        
+        session = get_http_session()
+        started = time.monotonic()
+        
+        try:
+            payload = self.prepare_openrouter_payload(conversation_history, user_message, user_first_name, config_index)
+            
+            async with session.post(
+                self.openrouter_url,
+                headers=self._get_openrouter_headers(config_index),
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                limiter.update_from_headers(response.headers, response.status, OPENROUTER_RATE_LIMIT_DEFAULT_BLOCK)
+                
+                # Handle rate limits (the limiter now holds this key back, so no backoff is needed)
+                if response.status == 429:
+                    logger.warning(f"⏰ Rate limit hit for config {config_index + 1} (model: {current_config['model']})")
+                    health.abort_attempt()
+                    return None, 0
+                
                 # Handle authentication errors
-                if response.status_code == 401:
-                    logger.error(f"🔐 Authentication failed for config {self.current_config_index + 1} (model: {current_config['model']}) - {response.text}")
-                    self._rotate_config()
-                    retries += 1
-                    time.sleep(1)
-                    continue
+                if response.status == 401:
+                    logger.error(f"🔐 Authentication failed for config {config_index + 1} (model: {current_config['model']}) - {await response.text()}")
+                    health.record_failure(fatal=True)
+                    return None, 1
                 
                 # Handle other errors
-                if response.status_code != 200:
-                    logger.error(f"❌ OpenRouter API error {response.status_code} for config {self.current_config_index + 1}: {response.text}")
-                    self._rotate_config()
-                    retries += 1
-                    time.sleep(1)
-                    continue
+                if response.status != 200:
+                    logger.error(f"❌ OpenRouter API error {response.status} for config {config_index + 1}: {await response.text()}")
+                    health.record_failure()
+                    return None, 1
                 
                 # Parse successful response
-                response.encoding = 'utf-8'
-                data = response.json()
+                data = json.loads(await response.text(encoding='utf-8'))
+            
+            if "choices" in data and data["choices"]:
+                full_text = data["choices"][0]["message"]["content"]
+                full_text = self._clean_response(full_text)
                 
-                if "choices" in data and data["choices"]:
-                    full_text = data["choices"][0]["message"]["content"]
-                    full_text = self._clean_response(full_text)
-                    
-                    if full_text.strip():
-                        logger.success(f"✅ OpenRouter success with config {self.current_config_index + 1} (model: {current_config['model']})")
-                        return full_text.strip()
-                    else:
-                        logger.warning(f"⚠️ Empty response from OpenRouter config {self.current_config_index + 1}")
+                if full_text.strip():
+                    latency = time.monotonic() - started
+                    self.latency_samples.append(latency)
+                    health.record_success(latency)
+                    logger.success(f"✅ OpenRouter success with config {config_index + 1} (model: {current_config['model']})")
+                    # Stick with the working config for the next message
+                    self.current_config_index = config_index
+                    return full_text.strip(), 0
                 else:
-                    logger.error(f"❌ No choices in OpenRouter response for config {self.current_config_index + 1}")
-                
-                self._rotate_config()
-                retries += 1
-                time.sleep(1)
-                
-            except requests.exceptions.Timeout:
-                logger.error(f"⏰ OpenRouter timeout with config {self.current_config_index + 1} (model: {current_config['model']})")
-                self._rotate_config()
-                retries += 1
-                time.sleep(1)
-            except requests.exceptions.ConnectionError:
-                logger.error(f"🔌 OpenRouter connection error with config {self.current_config_index + 1} (model: {current_config['model']})")
-                self._rotate_config()
-                retries += 1
-                time.sleep(2)
-            except Exception as e:
-                logger.error(f"💥 OpenRouter unexpected error with config {self.current_config_index + 1} (model: {current_config['model']}): {e}")
-                self._rotate_config()
-                retries += 1
-                time.sleep(1)
-        
-        # Reset to original config if all attempts fail
-        self.current_config_index = original_config_index
-        logger.error(f"💥 All {len(self.api_configs)} OpenRouter configs failed")
-        return None
+                    logger.warning(f"⚠️ Empty response from OpenRouter config {config_index + 1}")
+            else:
+                logger.error(f"❌ No choices in OpenRouter response for config {config_index + 1}")
+            health.record_failure()
+            return None, 1
+            
+        except asyncio.CancelledError:
+            # Lost a hedged race, the provider itself did nothing wrong
+            health.abort_attempt()
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ OpenRouter timeout with config {config_index + 1} (model: {current_config['model']})")
+            health.record_failure()
+            return None, 1
+        except aiohttp.ClientConnectionError:
+            logger.error(f"🔌 OpenRouter connection error with config {config_index + 1} (model: {current_config['model']})")
+            health.record_failure()
+            return None, 2
+        except Exception as e:
+            logger.error(f"💥 OpenRouter unexpected error with config {config_index + 1} (model: {current_config['model']}): {e}")
+            health.record_failure()
+            return None, 1
 
-    def _try_pollinations(self, conversation_history: List[Dict], user_message: str, user_first_name: str = None) -> str:
+    async def _try_pollinations(self, conversation_history: List[Dict], user_message: str, user_first_name: str = None, deadline: float = None) -> str:
         """Try to get response from Pollinations.ai text generation with conversation context"""
+        budget = POLLINATIONS_DEADLINE if deadline is None else min(POLLINATIONS_DEADLINE, self._remaining(deadline))
+        if budget <= 0:
+            logger.warning("⏰ No budget left for Pollinations.ai")
+            return None
+        
         try:
             prompt = self.prepare_pollinations_payload(conversation_history, user_message, user_first_name)
             logger.info("🔄 Attempting Pollinations.ai text generation with conversation context")
             
-            # Try different URL encoding formats
-            url_formats = [
-                f"{self.pollinations_text_url}/{prompt.replace(' ', '%20')}",
-                f"{self.pollinations_text_url}/{prompt.replace(' ', '+')}",
-                f"{self.pollinations_text_url}?prompt={prompt.replace(' ', '%20')}",
-                f"{self.pollinations_text_url}/{prompt.replace(' ', '-')}"
-            ]
+            # POST endpoint plus the legacy GET URL encodings, last known-good format first
+            request_formats = {
+                "post": ("POST", self.pollinations_text_url, {"messages": [{"role": "user", "content": prompt}], "model": "openai"}),
+                "path_percent": ("GET", f"{self.pollinations_text_url}/{prompt.replace(' ', '%20')}", None),
+                "path_plus": ("GET", f"{self.pollinations_text_url}/{prompt.replace(' ', '+')}", None),
+                "query": ("GET", f"{self.pollinations_text_url}?prompt={prompt.replace(' ', '%20')}", None),
+                "path_dash": ("GET", f"{self.pollinations_text_url}/{prompt.replace(' ', '-')}", None)
+            }
+            format_order = sorted(request_formats, key=lambda name: name != self.pollinations_format)
             
-            for i, url in enumerate(url_formats):
-                try:
-                    logger.debug(f"🔄 Pollinations.ai attempt {i + 1}/{len(url_formats)} with URL format")
-                    response = requests.get(url, timeout=20)
-                    
-                    if response.status_code == 200:
-                        full_text = response.text.strip()
-                        
-                        if full_text and len(full_text) > 5:  # Ensure meaningful response
-                            full_text = self._clean_response(full_text)
-                            logger.success(f"✅ Pollinations.ai success with format {i + 1}")
-                            return full_text
-                        else:
-                            logger.warning(f"⚠️ Pollinations.ai empty response with format {i + 1}")
-                    else:
-                        logger.warning(f"⚠️ Pollinations.ai format {i + 1} returned {response.status_code}")
-                        
-                except requests.exceptions.Timeout:
-                    logger.warning(f"⏰ Pollinations.ai timeout with format {i + 1}")
-                    continue
-                except requests.exceptions.ConnectionError:
-                    logger.warning(f"🔌 Pollinations.ai connection error with format {i + 1}")
-                    continue
-                except Exception as e:
-                    logger.warning(f"⚠️ Pollinations.ai format {i + 1} error: {e}")
-                    continue
+            response = await asyncio.wait_for(
+                self._race(
+                    [lambda name=name: self._request_pollinations(name, *request_formats[name], budget) for name in format_order],
+                    POLLINATIONS_RACE_STAGGER,
+                    len(format_order)
+                ),
+                timeout=budget
+            )
+            if response:
+                return response
             
-            logger.error("💥 All Pollinations.ai URL formats failed")
+            logger.error("💥 All Pollinations.ai request formats failed")
             return None
             
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ Pollinations.ai gave no answer within {budget:.1f}s")
+            return None
         except Exception as e:
             logger.error(f"💥 Pollinations.ai overall error: {e}")
             return None
 
-    def _rotate_config(self):
-        """Rotate to the next API configuration"""
-        self.current_config_index = (self.current_config_index + 1) % len(self.api_configs)
-        logger.debug(f"🔄 Rotated to config {self.current_config_index + 1}")
+    async def _request_pollinations(self, format_name: str, method: str, url: str, body: Optional[dict], timeout: float) -> Optional[str]:
+        """Make a single Pollinations.ai request in one of the supported formats"""
+        session = get_http_session()
+        try:
+            logger.debug(f"🔄 Pollinations.ai attempt with {format_name} format")
+            async with session.request(method, url, json=body, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                status = response.status
+                full_text = (await response.text()).strip() if status == 200 else ""
+            
+            if status != 200:
+                logger.warning(f"⚠️ Pollinations.ai {format_name} format returned {status}")
+                return None
+            if not full_text or len(full_text) <= 5:  # Ensure meaningful response
+                logger.warning(f"⚠️ Pollinations.ai empty response with {format_name} format")
+                return None
+            
+            full_text = self._clean_response(full_text)
+            self.pollinations_format = format_name
+            logger.success(f"✅ Pollinations.ai success with {format_name} format")
+            return full_text
+            
+        except asyncio.TimeoutError:
+            logger.warning(f"⏰ Pollinations.ai timeout with {format_name} format")
+        except aiohttp.ClientConnectionError:
+            logger.warning(f"🔌 Pollinations.ai connection error with {format_name} format")
+        except Exception as e:
+            logger.warning(f"⚠️ Pollinations.ai {format_name} format error: {e}")
+        return None
 
     def _clean_response(self, text: str) -> str:
         """Clean and format the AI response"""
@@ -299,16 +672,12 @@ class VeniceAI:
         logger.debug(f"🧹 Cleaned response: {text[:100]}...")
         return text
 
-    def _get_fallback_response(self) -> str:
+    def get_fallback_response(self) -> str:
         """Get a fallback response when all AI services fail"""
-        fallback_responses = [
-            "Oh darling, I'm feeling a bit shy right now! Can we chat again in a moment? 😘💕",
-            "My heart's racing too fast to think clearly! Give me a sec, sweetie? 💖✨",
-            "I'm blushing so hard I can't find the right words! Let's try again? 😊💝",
-            "You make me so flustered I can't respond properly! One more time, love? 💗🌹",
-            "Hmm, I'm having trouble finding the perfect words for you right now! Can we try again? 😔💕",
-            "My mind went blank thinking about you! Let me gather my thoughts and try again? 💖😊"
-        ]
-        response = random.choice(fallback_responses)
+        response = random.choice(FALLBACK_RESPONSES)
         logger.info(f"🔄 Using fallback response: {response}")
         return response
+
+    def is_fallback_response(self, text: str) -> bool:
+        """Whether the text is one of the canned fallback responses"""
+        return text in FALLBACK_RESPONSES
@@ -0,0 +1,148 @@
+import hashlib
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+from config import (
+    CONTEXT_HISTORY_TOKEN_BUDGET,
+    POLLINATIONS_HISTORY_TOKEN_BUDGET,
+    CONVERSATION_SUMMARY_TOKEN_BUDGET
+)
+
+# Approximate characters per token by model family (no tokenizer dependency needed at this precision)
+CHARS_PER_TOKEN = {
+    "deepseek/": 3.6,
+    "tngtech/": 3.6,
+    "qwen/": 3.4,
+    "google/": 4.0,
+    "openai/": 4.0,
+    "pollinations": 4.0
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators added by the chat template
+
+SUMMARY_ROLE = "system"
+FOLDED_HASHES_KEPT = 100
+
+class ContextWindowManager:
+    """Token-aware history packing with a rolling per-user summary of older turns"""
+
+    def count_tokens(self, text: str, model: str = None) -> int:
+        """Estimate the token count of a text for the given model"""
+        ratio = DEFAULT_CHARS_PER_TOKEN
+        for prefix, chars_per_token in CHARS_PER_TOKEN.items():
+            if model and model.startswith(prefix):
+                ratio = chars_per_token
+                break
+        return math.ceil(len(text) / ratio)
+
+    def count_message_tokens(self, message: Dict, model: str = None) -> int:
+        """Estimate the tokens a chat message costs including its template overhead"""
+        return self.count_tokens(message["content"], model) + MESSAGE_OVERHEAD_TOKENS
+
+    def budget_for(self, model: str) -> int:
+        """History token budget for a model"""
+        if model.startswith("pollinations"):
+            return POLLINATIONS_HISTORY_TOKEN_BUDGET
+        return CONTEXT_HISTORY_TOKEN_BUDGET
+
+    def pack(self, conversation_history: List[Dict], model: str, budget: int = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Fit history into the model's token budget, newest turns first.
+        The summary message (if any) is pinned at the front. Returns (packed, dropped).
+        """
+        if budget is None:
+            budget = self.budget_for(model)
+
+        pinned = [m for m in conversation_history if m["role"] == SUMMARY_ROLE]
+        turns = [m for m in conversation_history if m["role"] != SUMMARY_ROLE]
+
+        used = sum(self.count_message_tokens(m, model) for m in pinned)
+        if used > budget:
+            # Summary alone is too big for this model, drop it rather than the recent turns
+            pinned, used = [], 0
+
+        kept = []
+        for message in reversed(turns):
+            cost = self.count_message_tokens(message, model)
+            if used + cost > budget:
+                break
+            kept.append(message)
+            used += cost
+
+        kept.reverse()
+        dropped = turns[:len(turns) - len(kept)]
+        return pinned + kept, dropped
+
+    def with_summary(self, conversation_history: List[Dict], summary: Optional[str]) -> List[Dict]:
+        """Prefix the history with the summary as a pinned system message"""
+        if not summary:
+            return conversation_history
+        return [{"role": SUMMARY_ROLE, "content": f"What you remember from earlier chats: {summary}"}] + conversation_history
+
+    def with_memories(self, conversation_history: List[Dict], memories: List[str]) -> List[Dict]:
+        """Prefix the history with recalled snippets from older chats as a pinned system message"""
+        if not memories:
+            return conversation_history
+        return [{"role": SUMMARY_ROLE, "content": f"Things they told you before: {' | '.join(memories)}"}] + conversation_history
+
+    def fold(self, summary_doc: Optional[dict], messages: List[Dict]) -> Optional[dict]:
+        """
+        Compress turns that are leaving the context window into the summary document.
+        Returns the updated document, or None if nothing new was folded.
+        """
+        notes = list(summary_doc.get("notes", [])) if summary_doc else []
+        folded = list(summary_doc.get("folded", [])) if summary_doc else []
+        changed = False
+
+        for message in messages:
+            digest = self._digest(message)
+            if digest in folded:
+                continue
+            folded.append(digest)
+            changed = True
+
+            note = self._note(message)
+            if note and note not in notes:
+                notes.append(note)
+
+        if not changed:
+            return None
+
+        # Oldest notes go first once the summary outgrows its budget
+        while notes and self.count_tokens(" | ".join(notes)) > CONVERSATION_SUMMARY_TOKEN_BUDGET:
+            notes.pop(0)
+
+        return {"notes": notes, "folded": folded[-FOLDED_HASHES_KEPT:]}
+
+    def render(self, summary_doc: Optional[dict]) -> Optional[str]:
+        """Summary text for the prompt"""
+        if not summary_doc or not summary_doc.get("notes"):
+            return None
+        return " | ".join(summary_doc["notes"])
+
+    def messages_to_fold(self, conversation_history: List[Dict], history_limit: int, incoming: int = 2) -> List[Dict]:
+        """Turns that no longer fit the budget, plus the oldest ones the incoming messages push out of the history window"""
+        _, dropped = self.pack(conversation_history, "", CONTEXT_HISTORY_TOKEN_BUDGET)
+        overflow = len(conversation_history) + incoming - history_limit
+        if overflow > 0:
+            dropped = dropped + [m for m in conversation_history[:overflow] if m not in dropped]
+        if dropped:
+            logger.debug(f"🧠 {len(dropped)} turns leaving the context window")
+        return dropped
+
+    def _note(self, message: Dict) -> Optional[str]:
+        """Keep the first sentence of what the user said; Mila's own replies carry little to remember"""
+        if message["role"] != "user":
+            return None
+        content = " ".join(message["content"].split())
+        if len(content.split()) < 3:
+            return None
+        first_sentence = re.split(r"(?<=[.!?])\s", content)[0]
+        return f"User: {first_sentence[:120]}"
+
+    def _digest(self, message: Dict) -> str:
+        return hashlib.md5(f"{message['role']}:{message['content']}".encode("utf-8")).hexdigest()[:12]
+
+# Global instance
+context_window = ContextWindowManager()
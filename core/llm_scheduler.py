@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque
+from loguru import logger
+from config import LLM_MAX_CONCURRENCY, LLM_QUEUE_MAX_SIZE, LLM_QUEUE_MAX_WAIT
+
+class LLMScheduler:
+    """Admission control in front of VeniceAI: bounded concurrency, a bounded fair queue and load shedding"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queued = 0
+        # One FIFO per user, served round-robin so a chatty user can't starve the rest
+        self.queues: "OrderedDict[int, Deque[asyncio.Future]]" = OrderedDict()
+
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.peak_queue_depth = 0
+        self.wait_times = deque(maxlen=500)
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, max_wait: float = None) -> AsyncIterator[bool]:
+        """Hold an LLM slot for the block; yields False when the request was shed"""
+        admitted = await self.acquire(user_id, max_wait)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+    async def acquire(self, user_id: int, max_wait: float = None) -> bool:
+        """Wait for a slot; returns False if the queue is full or the wait exceeds the threshold (or the caller's max_wait)"""
+        max_wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        if self.in_flight < self.max_concurrency and not self.queued:
+            self.in_flight += 1
+            self._record_admission(0.0)
+            return True
+
+        if self.queued >= self.max_queue:
+            self.shed_queue_full += 1
+            logger.warning(f"🚦 LLM queue full ({self.queued}), shedding request from user {user_id}")
+            return False
+
+        ticket = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(user_id, deque()).append(ticket)
+        self.queued += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queued)
+        enqueued_at = time.monotonic()
+
+        try:
+            await asyncio.wait({ticket}, timeout=max_wait)
+        except asyncio.CancelledError:
+            self._abandon(user_id, ticket)
+            raise
+
+        if ticket.done() and not ticket.cancelled():
+            self._record_admission(time.monotonic() - enqueued_at)
+            return True
+
+        self._abandon(user_id, ticket)
+        self.shed_timeout += 1
+        logger.warning(f"🚦 User {user_id} waited {max_wait:.1f}s for an LLM slot, shedding to fallback")
+        return False
+
+    def release(self):
+        """Free a slot and hand it to the next user in line"""
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrency and self.queues:
+            user_id, queue = next(iter(self.queues.items()))
+            ticket = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.queues.move_to_end(user_id)
+            else:
+                del self.queues[user_id]
+
+            self.in_flight += 1
+            ticket.set_result(True)
+
+    def _abandon(self, user_id: int, ticket: asyncio.Future):
+        """Drop a ticket that gave up waiting, or give back the slot if it was granted meanwhile"""
+        if ticket.done() and not ticket.cancelled():
+            self.release()
+            return
+
+        ticket.cancel()
+        queue = self.queues.get(user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self.queued -= 1
+            if not queue:
+                del self.queues[user_id]
+
+    def _record_admission(self, wait: float):
+        self.admitted += 1
+        self.wait_times.append(wait)
+
+    def get_metrics(self) -> dict:
+        """Queue depth, wait-time and shedding counters"""
+        waits = sorted(self.wait_times)
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "peak_queue_depth": self.peak_queue_depth,
+            "users_waiting": len(self.queues),
+            "admitted": self.admitted,
+            "shed": self.shed_queue_full + self.shed_timeout,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        }
+
+# Global instance
+llm_scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_QUEUE_MAX_SIZE, LLM_QUEUE_MAX_WAIT)
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+import numpy as np
+from loguru import logger
+from config import (
+    MEMORY_INDEX_DIR,
+    MEMORY_INDEX_DIM,
+    MEMORY_INDEX_MAX_ENTRIES,
+    MEMORY_INDEX_MAX_USERS,
+    MEMORY_MIN_WORDS,
+    MEMORY_MIN_SCORE,
+    MEMORY_SNIPPET_LENGTH
+)
+
+WORD_RE = re.compile(r"\w+")
+
+class _UserIndex:
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.entries: List[Dict] = []
+
+class MemoryIndex:
+    """Per-user long-term memory: hashed n-gram vectors in NumPy, persisted as append-only files"""
+
+    def __init__(self, data_dir: str, dim: int, max_entries: int, max_users: int):
+        self.data_dir = data_dir
+        self.dim = dim
+        self.max_entries = max_entries
+        self.max_users = max_users
+        self.users: "OrderedDict[int, _UserIndex]" = OrderedDict()
+        # Backfills in flight, and messages saved while they run
+        self.building: Dict[int, asyncio.Future] = {}
+        self.pending: Dict[int, List[tuple]] = {}
+        # File I/O runs in worker threads; the lock keeps each user's two files appended in step,
+        # and the generation lets a write queued before forget() see that it is stale
+        self.file_lock = threading.Lock()
+        self.generations: Dict[int, int] = {}
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def embed(self, text: str) -> np.ndarray:
+        """Signed feature hashing of words, word bigrams and character trigrams, L2-normalised"""
+        words = WORD_RE.findall(text.lower())
+        features = list(words)
+        features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+
+        # crc32 is stable across processes, unlike hash(), so persisted vectors stay valid
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.dim, signs)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def is_memorable(self, role: str, content: str) -> bool:
+        """Only things the user said with some substance are worth remembering"""
+        return role == "user" and len(WORD_RE.findall(content)) >= MEMORY_MIN_WORDS
+
+    async def ensure(self, user_id: int, backfill: Callable[[], Awaitable[List[dict]]]) -> _UserIndex:
+        """Load a user's index, building it from their stored conversations the first time"""
+        index = self.users.get(user_id)
+        if index is not None:
+            self.users.move_to_end(user_id)
+            return index
+
+        if user_id in self.building:
+            return await asyncio.shield(self.building[user_id])
+
+        # While loading or building, messages saved meanwhile queue in pending and are added once cached
+        future = self.building[user_id] = asyncio.get_running_loop().create_future()
+        self.pending[user_id] = []
+        generation = self.generations.get(user_id, 0)
+        try:
+            if os.path.exists(self._paths(user_id)[1]):
+                index = await asyncio.to_thread(self._load, user_id, generation)
+                if self.pending[user_id] is None:
+                    # Forgotten while reading the files
+                    index = _UserIndex(self.dim)
+                    future.set_result(index)
+                    return index
+                self._cache(user_id, index)
+                await self.add(user_id, self.pending[user_id])
+                future.set_result(index)
+                return index
+
+            started = time.monotonic()
+            messages = await backfill()
+            index = _UserIndex(self.dim)
+            if self.pending[user_id] is None:
+                # History was cleared while reading it, don't resurrect it on disk
+                future.set_result(index)
+                return index
+            self._cache(user_id, index)
+
+            # Messages saved during the read may or may not be in it already
+            backfilled = [(m["role"], m["content"]) for m in messages]
+            late = [m for m in self.pending[user_id] if m not in backfilled[-len(self.pending[user_id]) * 2:]]
+            # Appending nothing still creates the files, so the index is on disk even if nothing was worth remembering
+            await self.add(user_id, backfilled + late, create=True)
+            logger.info(f"🧠 Built memory index for user {user_id}: {len(index.entries)} snippets "
+                        f"from {len(messages)} messages in {time.monotonic() - started:.2f}s")
+            future.set_result(index)
+            return index
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters get it re-raised; don't warn if there are none
+            raise
+        finally:
+            del self.building[user_id]
+            del self.pending[user_id]
+
+    async def add(self, user_id: int, messages: List[tuple], create: bool = False):
+        """Append new messages to the index if it is loaded, and to the user's files on disk"""
+        index = self.users.get(user_id)
+        if index is None:
+            if user_id in self.building:
+                if self.pending[user_id] is not None:
+                    self.pending[user_id].extend(messages)
+                return
+            # Never built: the first ensure() backfills these from the database.
+            # Evicted: embedding is stateless, so append and let the next load pick them up.
+            if not os.path.exists(self._paths(user_id)[1]):
+                return
+
+        new_entries = [
+            {"role": role, "content": " ".join(content.split())[:MEMORY_SNIPPET_LENGTH]}
+            for role, content in messages if self.is_memorable(role, content)
+        ]
+        if not new_entries and not create:
+            return
+
+        new_vectors = np.array([self.embed(entry["content"]) for entry in new_entries], dtype=np.float32).reshape(-1, self.dim)
+        # Memory first, so a search right after never waits on the disk write
+        if index is not None:
+            index.vectors = np.vstack([index.vectors, new_vectors])[-self.max_entries:]
+            index.entries = (index.entries + new_entries)[-self.max_entries:]
+
+        try:
+            await asyncio.to_thread(self._append, user_id, new_entries, new_vectors, self.generations.get(user_id, 0))
+        except OSError as e:
+            logger.error(f"❌ Failed to persist memory index for user {user_id}: {e}")
+
+    def search(self, user_id: int, query: str, k: int, exclude: Optional[List[str]] = None) -> List[str]:
+        """Top-k stored snippets most similar to the query"""
+        index = self.users.get(user_id)
+        if index is None or not index.entries:
+            return []
+
+        query_vector = self.embed(query)
+        if not query_vector.any():
+            return []
+
+        scores = index.vectors @ query_vector
+        candidates = min(len(scores), k * 3)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        skip = {" ".join(text.split())[:MEMORY_SNIPPET_LENGTH] for text in exclude or []}
+
+        results = []
+        for i in top[np.argsort(-scores[top])]:
+            content = index.entries[i]["content"]
+            if scores[i] < MEMORY_MIN_SCORE or len(results) >= k:
+                break
+            if content not in skip and content not in results:
+                results.append(content)
+        return results
+
+    async def forget(self, user_id: int):
+        """Drop a user's index from memory and disk"""
+        self.users.pop(user_id, None)
+        if user_id in self.pending:
+            self.pending[user_id] = None
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        await asyncio.to_thread(self._remove, user_id)
+
+    def _append(self, user_id: int, entries: List[Dict], vectors: np.ndarray, generation: int):
+        with self.file_lock:
+            if self.generations.get(user_id, 0) != generation:
+                return
+            vectors_path, entries_path = self._paths(user_id)
+            with open(entries_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            with open(vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+
+    def _remove(self, user_id: int):
+        with self.file_lock:
+            for path in self._paths(user_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"❌ Failed to remove memory file {path}: {e}")
+
+    def _load(self, user_id: int, generation: int) -> _UserIndex:
+        vectors_path, entries_path = self._paths(user_id)
+        index = _UserIndex(self.dim)
+        try:
+            with self.file_lock:
+                if self.generations.get(user_id, 0) != generation:
+                    return index
+                with open(entries_path, encoding="utf-8") as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+                vectors = np.fromfile(vectors_path, dtype=np.float32) if os.path.exists(vectors_path) else np.zeros(0, dtype=np.float32)
+                vectors = vectors[:len(vectors) // self.dim * self.dim].reshape(-1, self.dim)
+
+                # A crash between the two appends can leave the files one batch apart
+                count = min(len(entries), len(vectors))
+                index.entries = entries[:count][-self.max_entries:]
+                index.vectors = vectors[:count][-self.max_entries:]
+
+                if count != len(entries) or count != len(vectors) or count > 2 * self.max_entries:
+                    self._rewrite(user_id, index)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Failed to load memory index for user {user_id}, starting empty: {e}")
+        return index
+
+    def _rewrite(self, user_id: int, index: _UserIndex):
+        """Compact the append-only files down to what is kept in memory"""
+        vectors_path, entries_path = self._paths(user_id)
+        with open(entries_path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in index.entries)
+        index.vectors.astype(np.float32).tofile(vectors_path + ".tmp")
+        os.replace(entries_path + ".tmp", entries_path)
+        os.replace(vectors_path + ".tmp", vectors_path)
+
+    def _cache(self, user_id: int, index: _UserIndex):
+        self.users[user_id] = index
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+
+    def _paths(self, user_id: int):
+        base = os.path.join(self.data_dir, str(user_id))
+        return f"{base}.vec", f"{base}.jsonl"
+
+# Global instance
+memory_index = MemoryIndex(MEMORY_INDEX_DIR, MEMORY_INDEX_DIM, MEMORY_INDEX_MAX_ENTRIES, MEMORY_INDEX_MAX_USERS)
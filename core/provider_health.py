@@ -0,0 +1,92 @@
+import time
+from loguru import logger
+from config import (
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_ERROR_RATE,
+    CIRCUIT_BREAKER_COOLDOWN,
+    CIRCUIT_BREAKER_AUTH_COOLDOWN,
+    PROVIDER_HEALTH_EWMA_ALPHA
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class ProviderHealth:
+    """Health record for one OpenRouter config: EWMA latency, error rate and breaker state"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = CIRCUIT_BREAKER_COOLDOWN
+        self.probe_in_flight = False
+
+    def can_attempt(self) -> bool:
+        """Whether routing should consider this provider right now (does not change state)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN:
+            return not self.probe_in_flight
+        return time.monotonic() - self.opened_at >= self.cooldown
+
+    def begin_attempt(self) -> bool:
+        """Claim an attempt; an open breaker past its cooldown lets exactly one probe through"""
+        if self.state == CLOSED:
+            return True
+        if not self.can_attempt():
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+            logger.info(f"🩺 Probing {self.name} after {self.cooldown:.0f}s cooldown")
+        self.probe_in_flight = True
+        return True
+
+    def abort_attempt(self):
+        """Release a probe that was cancelled before it produced a result"""
+        self.probe_in_flight = False
+
+    def record_success(self, latency: float):
+        """Record a good answer and close the breaker"""
+        self.samples += 1
+        self.ewma_latency = latency if self.ewma_latency is None else (
+            PROVIDER_HEALTH_EWMA_ALPHA * latency + (1 - PROVIDER_HEALTH_EWMA_ALPHA) * self.ewma_latency
+        )
+        self.error_rate = (1 - PROVIDER_HEALTH_EWMA_ALPHA) * self.error_rate
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        if self.state != CLOSED:
+            logger.success(f"🩺 {self.name} recovered, circuit closed")
+        self.state = CLOSED
+        self.cooldown = CIRCUIT_BREAKER_COOLDOWN
+
+    def record_failure(self, fatal: bool = False, cooldown: float = None):
+        """Record a failed attempt, opening the breaker when the provider looks broken"""
+        self.samples += 1
+        self.error_rate = PROVIDER_HEALTH_EWMA_ALPHA + (1 - PROVIDER_HEALTH_EWMA_ALPHA) * self.error_rate
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+
+        should_open = (
+            fatal
+            or self.state == HALF_OPEN
+            or self.consecutive_failures >= CIRCUIT_BREAKER_FAILURE_THRESHOLD
+            or (self.samples >= CIRCUIT_BREAKER_FAILURE_THRESHOLD and self.error_rate >= CIRCUIT_BREAKER_ERROR_RATE)
+        )
+        if should_open:
+            if cooldown is None:
+                cooldown = CIRCUIT_BREAKER_AUTH_COOLDOWN if fatal else CIRCUIT_BREAKER_COOLDOWN
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.cooldown = cooldown
+            logger.warning(f"🚧 Circuit opened for {self.name} for {cooldown:.0f}s (error rate {self.error_rate:.0%})")
+
+    def score(self) -> float:
+        """Expected cost of routing here: latency inflated by the error rate (untried providers go first)"""
+        if self.ewma_latency is None:
+            return 0.0
+        return self.ewma_latency / max(0.05, 1 - self.error_rate)
@@ -0,0 +1,98 @@
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+from loguru import logger
+
+class TokenBucket:
+    """Local request budget for one API key, corrected by the provider's rate-limit headers"""
+
+    def __init__(self, name: str, capacity: int, period: float):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_rate = capacity / period  # Tokens per second
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def has_budget(self) -> bool:
+        """Whether a request would be admitted right now (does not consume a token)"""
+        return self.time_until_available() == 0
+
+    def time_until_available(self) -> float:
+        """Seconds until the next request would be admitted"""
+        self._refill()
+        wait = max(0.0, self.blocked_until - time.monotonic())
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.refill_rate)
+        return wait
+
+    def try_acquire(self) -> bool:
+        """Consume a token if the key has budget left"""
+        if not self.has_budget():
+            return False
+        self.tokens -= 1
+        return True
+
+    def refund(self):
+        """Give back a token for a request that was never sent"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block_for(self, seconds: float):
+        """Reject everything for the given time, e.g. after a 429"""
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        logger.warning(f"⏳ {self.name} rate limited for {seconds:.1f}s")
+
+    def update_from_headers(self, headers: Mapping[str, str], status: int, default_block: float):
+        """Sync the bucket with X-RateLimit-* / Retry-After headers from a response"""
+        remaining = _parse_float(headers.get("X-RateLimit-Remaining"))
+        if remaining is not None:
+            self._refill()
+            self.tokens = min(self.tokens, remaining)
+
+        limit = _parse_float(headers.get("X-RateLimit-Limit"))
+        if limit and limit < self.capacity:
+            self.capacity = limit
+            self.tokens = min(self.tokens, limit)
+
+        if status != 429 and remaining != 0:
+            return
+
+        wait = _parse_retry_after(headers.get("Retry-After"))
+        if wait is None:
+            wait = _parse_reset(headers.get("X-RateLimit-Reset"))
+        self.block_for(wait if wait is not None else default_block)
+
+def _parse_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    seconds = _parse_float(value)
+    if seconds is not None:
+        return max(0.0, seconds)
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """X-RateLimit-Reset is an epoch timestamp (OpenRouter sends milliseconds)"""
+    reset = _parse_float(value)
+    if reset is None:
+        return None
+    if reset > 1e11:
+        reset /= 1000
+    return max(0.0, reset - time.time())
@@ -0,0 +1,124 @@
+import random
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+from loguru import logger
+from config import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_POOL_SIZE,
+    RESPONSE_CACHE_MAX_MESSAGE_LENGTH
+)
+
+# Stands in for the user's name inside cached replies so they can be shared between users
+NAME_PLACEHOLDER = "\x00name\x00"
+
+class _Entry:
+    def __init__(self):
+        self.replies: List[str] = []
+        self.created_at = time.monotonic()
+
+class ResponseCache:
+    """TTL + LRU cache of small reply pools for short, high-frequency messages like "hi" or "good morning" """
+
+    def __init__(self, max_entries: int, ttl: float, pool_size: int, max_message_length: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self.max_message_length = max_message_length
+        self.entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.avg_generation_latency = 0.0
+        self.latency_saved = 0.0
+
+    def normalize(self, message: str) -> str:
+        """Lowercase, drop punctuation/emoji and squeeze stretched letters ("hiiii!!" -> "hii")"""
+        text = re.sub(r"[^\w\s]", " ", message.lower())
+        text = re.sub(r"(.)\1{2,}", r"\1\1", text)
+        return " ".join(text.split())
+
+    def fingerprint(self) -> str:
+        """Coarse context shared by every user: the part of the day"""
+        hour = datetime.now().hour
+        return "night" if hour < 5 else "morning" if hour < 12 else "afternoon" if hour < 18 else "evening"
+
+    def _key(self, message: str) -> Optional[Tuple[str, str]]:
+        normalized = self.normalize(message)
+        if not normalized or len(normalized) > self.max_message_length:
+            return None
+        return normalized, self.fingerprint()
+
+    def cacheable(self, message: str) -> bool:
+        """Short messages are answered from shared pools, generated without any per-user context"""
+        return self._key(message) is not None
+
+    def get(self, message: str, user_first_name: str = None) -> Optional[str]:
+        """Return a cached reply once the key's pool is full, personalised for this user"""
+        key = self._key(message)
+        if key is None:
+            return None
+
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry.created_at > self.ttl:
+            del self.entries[key]
+            entry = None
+
+        # Keep generating until the pool holds enough variety to rotate through
+        if entry is None or len(entry.replies) < self.pool_size:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.latency_saved += self.avg_generation_latency
+        logger.debug(f"💾 Response cache hit for '{key[0]}' ({key[1]})")
+        return random.choice(entry.replies).replace(NAME_PLACEHOLDER, user_first_name or "darling")
+
+    def put(self, message: str, response: str, latency: float, user_first_name: str = None):
+        """
+        Add a freshly generated reply to the key's pool.
+        Pools are shared between users, so the reply must come from a context-free generation.
+        """
+        key = self._key(message)
+        if key is None or not response:
+            return
+
+        self.avg_generation_latency = latency if not self.avg_generation_latency else (
+            0.2 * latency + 0.8 * self.avg_generation_latency
+        )
+
+        if user_first_name and user_first_name != "darling":
+            response = re.sub(rf"\b{re.escape(user_first_name)}\b", NAME_PLACEHOLDER, response)
+
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = _Entry()
+        if len(entry.replies) < self.pool_size and response not in entry.replies:
+            entry.replies.append(response)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_metrics(self) -> dict:
+        """Hit rate and estimated latency saved"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups * 100) if lookups else 0.0,
+            "latency_saved": self.latency_saved
+        }
+
+# Global instance
+response_cache = ResponseCache(
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_POOL_SIZE,
+    RESPONSE_CACHE_MAX_MESSAGE_LENGTH
+)
@@ -1,25 +1,552 @@
+import asyncio
 import logging
+import time
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import List, Optional
-from pymongo import MongoClient
-from config import MONGO_DB_URI, MONGO_DB_NAME
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from bson import Binary
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from utils.write_behind import write_behind
+from utils.hyperloglog import HyperLogLog, precision_for_error
+from config import (
+    MONGO_DB_URI,
+    MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    CONVERSATION_HISTORY_LIMIT,
+    HISTORY_CACHE_MAX_USERS,
+    USER_STATE_CACHE_TTL,
+    USER_STATE_CACHE_MAX_USERS,
+    LAST_ACTIVITY_FLUSH_INTERVAL,
+    CONVERSATION_BUCKET_SIZE,
+    ACTIVE_USERS_HLL_ERROR,
+    ACTIVE_USERS_SKETCH_FLUSH_INTERVAL,
+    ACTIVE_USERS_EXACT,
+    REMINDER_BATCH_SIZE,
+    CONVERSATION_RETENTION_DAYS,
+    IMAGE_RETENTION_DAYS,
+    REMINDER_RETENTION_DAYS,
+    RETENTION_GRACE_DAYS
+)
 
 logger = logging.getLogger(__name__)
 
-class BotDatabase:
+# Indexes backing every query the database layer runs, keyed by collection
+INDEXES = {
+    "conversation_buckets": [
+        IndexModel([("user_id", ASCENDING), ("end", DESCENDING)], name="user_end"),
+        IndexModel([("user_id", ASCENDING), ("open", ASCENDING)], name="user_open")
+    ],
+    # Legacy one-document-per-message layout, only read by the bucket migration
+    "conversations": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp")
+    ],
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("is_verified", ASCENDING), ("last_activity", ASCENDING)], name="verified_last_activity"),
+        IndexModel([("is_verified", ASCENDING), ("joined_at", ASCENDING)], name="verified_joined_at"),
+        # Lets the reminder scan walk verified users in user_id order instead of sorting in memory
+        IndexModel([("is_verified", ASCENDING), ("user_id", ASCENDING)], name="verified_user_id"),
+        IndexModel([("history_reap_pending", ASCENDING)], name="history_reap_pending", sparse=True)
+    ],
+    "reminders": [
+        IndexModel([("user_id", ASCENDING), ("deleted", ASCENDING), ("sent_at", DESCENDING)], name="user_deleted_sent_at"),
+        IndexModel([("responded", ASCENDING), ("deleted", ASCENDING), ("sent_at", ASCENDING)], name="pending_sent_at")
+    ],
+    "conversation_stats": [
+        IndexModel([("key", ASCENDING)], name="key", unique=True)
+    ],
+    "stat_buckets": [
+        IndexModel([("kind", ASCENDING), ("date", ASCENDING)], name="kind_date", unique=True)
+    ],
+    "activity_sketches": [
+        IndexModel([("date", ASCENDING)], name="date", unique=True)
+    ],
+    "conversation_summaries": [
+        IndexModel([("user_id", ASCENDING)], name="user_id", unique=True)
+    ]
+}
+
+# How long each collection is kept, as (date field, days); the archiver moves older documents out
+# and a single-field TTL index on the same field removes anything it missed after the grace period
+RETENTION = {
+    "conversation_buckets": ("end", CONVERSATION_RETENTION_DAYS),
+    "conversations": ("timestamp", CONVERSATION_RETENTION_DAYS),
+    "image_generations": ("timestamp", IMAGE_RETENTION_DAYS),
+    "reminders": ("sent_at", REMINDER_RETENTION_DAYS)
+}
+
+def _day_start(moment: datetime) -> datetime:
+    """Midnight of the day a moment falls on, the key of its daily stat bucket"""
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() winning plan"""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+class HistoryCache:
+    """LRU-bounded per-user ring buffers of the most recent conversation messages"""
+
+    def __init__(self, max_users: int, size: int):
+        self.max_users = max_users
+        self.size = size
+        self.buffers: "OrderedDict[int, Deque[dict]]" = OrderedDict()
+        # user_id -> [reads in flight, written meanwhile]; a read that raced a write must not be cached
+        self.loading: Dict[int, list] = {}
+
+    def get(self, user_id: int, limit: int) -> Optional[List[dict]]:
+        buffer = self.buffers.get(user_id)
+        if buffer is None or limit > self.size:
+            return None
+        self.buffers.move_to_end(user_id)
+        return [dict(m) for m in list(buffer)[-limit:]] if limit > 0 else []
+
+    def begin_load(self, user_id: int):
+        self.loading.setdefault(user_id, [0, False])[0] += 1
+
+    def end_load(self, user_id: int, messages: Optional[List[dict]]):
+        """Cache a finished read unless the user's history changed while it was in flight"""
+        state = self.loading[user_id]
+        state[0] -= 1
+        if messages is not None and not state[1]:
+            self.load(user_id, messages)
+        if not state[0]:
+            del self.loading[user_id]
+
+    def load(self, user_id: int, messages: List[dict]):
+        self.buffers[user_id] = deque(messages[-self.size:], maxlen=self.size)
+        self.buffers.move_to_end(user_id)
+        while len(self.buffers) > self.max_users:
+            self.buffers.popitem(last=False)
+
+    def append(self, user_id: int, messages: List[dict]):
+        """Write-through for users whose buffer is loaded; others load lazily on next read"""
+        self._mark_written(user_id)
+        buffer = self.buffers.get(user_id)
+        if buffer is not None:
+            buffer.extend(messages)
+
+    def invalidate(self, user_id: int):
+        self._mark_written(user_id)
+        self.buffers.pop(user_id, None)
+
+    def _mark_written(self, user_id: int):
+        if user_id in self.loading:
+            self.loading[user_id][1] = True
+
+MISSING = object()
+
+class UserStateCache:
+    """LRU-bounded per-user fields read on every message, each trusted for a TTL"""
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        # user_id -> field -> (expires at, value)
+        self.entries: "OrderedDict[int, Dict[str, Tuple[float, object]]]" = OrderedDict()
+
+    def get(self, user_id: int, field: str):
+        """Cached value, or MISSING if absent or expired"""
+        entry = self.entries.get(user_id)
+        if entry is None or field not in entry:
+            return MISSING
+        expires, value = entry[field]
+        if expires < time.monotonic():
+            del entry[field]
+            return MISSING
+        self.entries.move_to_end(user_id)
+        return value
+
+    def set(self, user_id: int, **fields):
+        expires = time.monotonic() + self.ttl
+        entry = self.entries.setdefault(user_id, {})
+        entry.update((field, (expires, value)) for field, value in fields.items())
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self.entries.pop(user_id, None)
+
+class ActivityTracker:
+    """Coalesces last_activity writes: the first touch in an interval is written on the next flush, later ones at its end"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.dirty: Dict[int, datetime] = {}
+        # user_id -> monotonic start of its current interval, oldest first
+        self.windows: "OrderedDict[int, float]" = OrderedDict()
+        self.deferred: Dict[int, datetime] = {}
+
+    @property
+    def pending(self) -> int:
+        self._expire()
+        return len(self.dirty)
+
+    def touch(self, user_id: int, moment: datetime):
+        if user_id in self.windows and time.monotonic() - self.windows[user_id] < self.interval:
+            self.deferred[user_id] = moment
+            return
+        self.deferred.pop(user_id, None)
+        self.dirty[user_id] = moment
+        self.windows[user_id] = time.monotonic()
+        self.windows.move_to_end(user_id)
+
+    def latest(self, user_id: int) -> Optional[datetime]:
+        """Activity not written to Mongo yet, if any"""
+        return self.deferred.get(user_id) or self.dirty.get(user_id)
+
+    def drain(self):
+        """Make every deferred write due, for shutdown"""
+        self.dirty.update(self.deferred)
+        self.deferred.clear()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.windows:
+            user_id, started = next(iter(self.windows.items()))
+            if now - started < self.interval:
+                break
+            del self.windows[user_id]
+            if user_id in self.deferred:
+                # The trailing write opens the next interval
+                self.dirty[user_id] = self.deferred.pop(user_id)
+                self.windows[user_id] = now
+
+    async def flush(self, db) -> int:
+        dirty, self.dirty = self.dirty, {}
+        try:
+            await db["users"].bulk_write([
+                UpdateOne({"user_id": user_id}, {"$max": {"last_activity": moment}}, upsert=True)
+                for user_id, moment in dirty.items()
+            ], ordered=False)
+        except Exception as e:
+            logger.error(f"Error writing last activity, will retry: {e}")
+            # $max makes a replay harmless
+            for user_id, moment in dirty.items():
+                self.dirty[user_id] = max(moment, self.dirty.get(user_id, moment))
+        return 1
+
+class DailySketchStore:
+    """
+    Per-day HyperLogLog sketches of active users, kept merged in memory.
+    A day is only written back when a new user actually changed its registers, at most once per interval.
+    """
+
+    def __init__(self, collection: str, precision: int, interval: float):
+        self.collection = collection
+        self.precision = precision
+        self.interval = interval
+        self.days: Dict[datetime, HyperLogLog] = {}
+        self.dirty: set = set()
+        self.flushed_at = time.monotonic()
+
+    @property
+    def pending(self) -> int:
+        return len(self.dirty) if time.monotonic() - self.flushed_at >= self.interval else 0
+
+    def add(self, day: datetime, value):
+        sketch = self.days.get(day)
+        if sketch is None:
+            sketch = self.days[day] = HyperLogLog(self.precision)
+        # Users already counted today leave the registers untouched, so there is nothing to write
+        if sketch.add(value):
+            self.dirty.add(day)
+
+    def drain(self):
+        """Make dirty days due now, for shutdown"""
+        self.flushed_at = float("-inf")
+
+    async def flush(self, db) -> int:
+        """Read-merge-write each dirty day; returns the number of round trips"""
+        dirty, self.dirty = self.dirty, set()
+        self.flushed_at = time.monotonic()
+        round_trips = 0
+        for day in dirty:
+            try:
+                trips, merged = await self._merge(db, day, self.days[day])
+                round_trips += trips
+                # Adopt other writers' registers so their users don't mark the day dirty again
+                self.days[day].merge(merged)
+            except Exception as e:
+                logger.error(f"Error saving activity sketch for {day:%Y-%m-%d}, will retry: {e}")
+                # Merging is idempotent, so a retry can never double count
+                self.dirty.add(day)
+
+        # Only today (and yesterday, around midnight) still receives adds
+        today = _day_start(datetime.now())
+        for day in [d for d in self.days if d < today - timedelta(days=1) and d not in self.dirty]:
+            del self.days[day]
+        return round_trips
+
+    async def _merge(self, db, day: datetime, sketch: HyperLogLog) -> Tuple[int, HyperLogLog]:
+        collection = db[self.collection]
+        for attempt in range(1, 6):
+            stored = await collection.find_one({"date": day})
+            if stored is None:
+                try:
+                    await collection.insert_one({
+                        "date": day, "precision": self.precision, "registers": Binary(sketch.to_bytes()), "version": 1
+                    })
+                    return attempt * 2, sketch
+                except DuplicateKeyError:
+                    continue
+
+            merged = HyperLogLog(self.precision, sketch.to_bytes())
+            if stored.get("precision") == self.precision:
+                merged.merge(HyperLogLog.from_bytes(stored["precision"], stored["registers"]))
+            else:
+                logger.warning(f"Activity sketch precision changed, restarting the sketch for {day:%Y-%m-%d}")
+
+            # Optimistic concurrency: only write over the version that was read
+            result = await collection.update_one(
+                {"date": day, "version": stored["version"]},
+                {"$set": {"precision": self.precision, "registers": Binary(merged.to_bytes())}, "$inc": {"version": 1}}
+            )
+            if result.matched_count:
+                return attempt * 2, merged
+        raise RuntimeError("too much contention merging activity sketch")
+
+    async def load(self, db, since: datetime) -> Dict[datetime, HyperLogLog]:
+        """Stored sketches from a day onwards, with anything not yet flushed merged in"""
+        sketches = {}
+        async for doc in db[self.collection].find({"date": {"$gte": since}}):
+            if doc.get("precision") == self.precision:
+                sketches[doc["date"]] = HyperLogLog.from_bytes(doc["precision"], doc["registers"])
+        for day, sketch in self.days.items():
+            if day >= since:
+                sketches.setdefault(day, HyperLogLog(self.precision)).merge(sketch)
+        return sketches
+
+class ConversationBucketWriter:
+    """Buffers messages per user and appends them to bounded bucket documents on each write-behind flush"""
+
+    def __init__(self, collection: str, bucket_size: int):
+        self.collection = collection
+        self.bucket_size = bucket_size
+        self.messages: Dict[int, List[dict]] = {}
+
+    @property
+    def pending(self) -> int:
+        return sum(len(messages) for messages in self.messages.values())
+
+    def has_pending(self, user_id: int) -> bool:
+        return user_id in self.messages
+
+    def add(self, user_id: int, messages: List[dict]):
+        self.messages.setdefault(user_id, []).extend(messages)
+
+    async def flush(self, db) -> int:
+        """Append every user's buffered messages concurrently; returns the number of round trips"""
+        pending, self.messages = self.messages, {}
+        round_trips = await asyncio.gather(*(
+            self._append(db[self.collection], user_id, messages) for user_id, messages in pending.items()
+        ))
+        return sum(round_trips)
+
+    async def _append(self, collection, user_id: int, messages: List[dict]) -> int:
+        round_trips = 0
+        for i in range(0, len(messages), self.bucket_size):
+            chunk = messages[i:i + self.bucket_size]
+            try:
+                # Only the open bucket takes writes, and only while the whole chunk fits
+                result = await collection.update_one(
+                    {"user_id": user_id, "open": True, "count": {"$lte": self.bucket_size - len(chunk)}},
+                    {
+                        "$push": {"messages": {"$each": chunk}},
+                        "$inc": {"count": len(chunk)},
+                        "$min": {"start": chunk[0]["timestamp"]},
+                        "$max": {"end": chunk[-1]["timestamp"]}
+                    },
+                    upsert=True
+                )
+                round_trips += 1
+                if result.upserted_id is not None:
+                    # A new bucket was opened, so the full one stops taking writes
+                    await collection.update_many(
+                        {"user_id": user_id, "open": True, "_id": {"$ne": result.upserted_id}},
+                        {"$set": {"open": False}}
+                    )
+                    round_trips += 1
+            except Exception as e:
+                logger.error(f"Error appending conversation bucket for user {user_id}, will retry: {e}")
+                self.messages[user_id] = messages[i:] + self.messages.get(user_id, [])
+                break
+        return round_trips
+
+# Shared by every database instance, so all handlers see the same buffers
+history_cache = HistoryCache(HISTORY_CACHE_MAX_USERS, CONVERSATION_HISTORY_LIMIT)
+activity_sketches = DailySketchStore("activity_sketches", precision_for_error(ACTIVE_USERS_HLL_ERROR), ACTIVE_USERS_SKETCH_FLUSH_INTERVAL)
+write_behind.register(activity_sketches)
+bucket_writer = ConversationBucketWriter("conversation_buckets", CONVERSATION_BUCKET_SIZE)
+write_behind.register(bucket_writer)
+user_state = UserStateCache(USER_STATE_CACHE_MAX_USERS, USER_STATE_CACHE_TTL)
+last_activity = ActivityTracker(LAST_ACTIVITY_FLUSH_INTERVAL)
+write_behind.register(last_activity)
+
+class AsyncBotDatabase:
+    """Process-wide MongoDB access; import the shared `db` instance rather than creating another pool"""
+
     def __init__(self):
         try:
-            self.client = MongoClient(MONGO_DB_URI)
+            self.client = AsyncIOMotorClient(
+                MONGO_DB_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS
+            )
             self.db = self.client[MONGO_DB_NAME]
             self.users_collection = self.db["users"]
-            self.conversations_collection = self.db["conversations"]
+            self.conversation_buckets = self.db["conversation_buckets"]
             self.conversation_stats = self.db["conversation_stats"]
+            self.conversation_summaries = self.db["conversation_summaries"]
+            self.stat_buckets = self.db["stat_buckets"]
+            self.activity_sketches = self.db["activity_sketches"]
+            self.stats_snapshots = self.db["stats_snapshots"]
+            write_behind.bind(self.db)
             logger.info("MongoDB initialized")
         except Exception as e:
             logger.error(f"MongoDB error: {e}")
             raise
 
-    def add_user(self, user_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None):
+    async def connect(self):
+        """Reach the server and open the minimum pool up front so the first requests skip the handshake"""
+        started = time.monotonic()
+        await self.client.admin.command("ping")
+        # Concurrent pings each check out their own socket, filling the pool
+        await asyncio.gather(*(self.client.admin.command("ping") for _ in range(MONGO_MIN_POOL_SIZE)))
+        logger.info(f"MongoDB connected, {MONGO_MIN_POOL_SIZE} connections warmed in {time.monotonic() - started:.2f}s")
+
+    async def close(self):
+        """Flush buffered writes, then close every pooled connection"""
+        last_activity.drain()
+        activity_sketches.drain()
+        await write_behind.stop()
+        self.client.close()
+        logger.info("MongoDB connection closed")
+
+    async def ensure_indexes(self) -> bool:
+        """Create any missing indexes; safe to run on every startup"""
+        ok = True
+        for collection, indexes in INDEXES.items():
+            try:
+                await self.db[collection].create_indexes(indexes)
+            except OperationFailure as e:
+                # Usually an existing index with the same name but different options, or duplicate keys
+                logger.error(f"Could not create indexes on {collection}: {e}")
+                ok = False
+        logger.info("MongoDB indexes ensured")
+        return ok
+
+    async def ensure_retention_indexes(self) -> bool:
+        """
+        Apply every collection's retention TTL right away. Only for deployments without the archiver;
+        otherwise the archiver applies each TTL once it has drained that collection, so nothing expires unarchived.
+        """
+        ok = True
+        for collection, (field, days) in RETENTION.items():
+            ok = await self.ensure_ttl(collection, field, days) and ok
+        return ok
+
+    async def ensure_ttl(self, collection: str, field: str, days: int) -> bool:
+        """Create the retention index on a date field, or bring an existing one in line with the setting"""
+        expire_after = (days + RETENTION_GRACE_DAYS) * 86400 if days > 0 else None
+        options = {"expireAfterSeconds": expire_after} if expire_after else {}
+        try:
+            await self.db[collection].create_index([(field, ASCENDING)], name=field, **options)
+            return True
+        except OperationFailure:
+            pass
+        try:
+            if expire_after:
+                # Same key with a different expiry (or none yet): change it in place instead of rebuilding
+                await self.db.command("collMod", collection, index={"keyPattern": {field: 1}, "expireAfterSeconds": expire_after})
+            else:
+                # An expiry cannot be removed in place, so retention=0 rebuilds the index without one
+                await self.db[collection].drop_index(field)
+                await self.db[collection].create_index([(field, ASCENDING)], name=field)
+            return True
+        except OperationFailure as e:
+            logger.error(f"Could not set retention on {collection}.{field}: {e}")
+            return False
+
+    def _hot_queries(self) -> List[dict]:
+        """The queries on the chat, stats and reminder hot paths, as explain() specs"""
+        now = datetime.now()
+        return [
+            {"name": "conversation history", "collection": "conversation_buckets",
+             "filter": {"user_id": 0}, "sort": [("end", DESCENDING)], "limit": 1},
+            {"name": "open conversation bucket", "collection": "conversation_buckets",
+             "filter": {"user_id": 0, "open": True, "count": {"$lte": CONVERSATION_BUCKET_SIZE - 2}}},
+            {"name": "active users (exact)", "collection": "conversation_buckets",
+             "pipeline": [{"$match": {"end": {"$gte": now - timedelta(days=7)}}}, {"$group": {"_id": "$user_id"}}]},
+            {"name": "user lookup", "collection": "users", "filter": {"user_id": 0}},
+            {"name": "verified users", "collection": "users", "filter": {"is_verified": True}},
+            {"name": "activity sketches", "collection": "activity_sketches",
+             "filter": {"date": {"$gte": _day_start(now) - timedelta(days=29)}}},
+            {"name": "new users (24h)", "collection": "users",
+             "filter": {"is_verified": True, "joined_at": {"$gte": now - timedelta(hours=24)}}},
+            {"name": "inactive users", "collection": "users",
+             "filter": {"is_verified": True, "last_activity": {"$lt": now}}},
+            {"name": "users due a reminder", "collection": "users",
+             "pipeline": [{"$match": {"is_verified": True, "user_id": {"$gt": 0},
+                                      "$or": [{"last_activity": {"$lt": now}}, {"last_activity": {"$exists": False}}]}},
+                          {"$sort": {"user_id": 1}}, {"$limit": REMINDER_BATCH_SIZE}]},
+            {"name": "recent reminder", "collection": "reminders",
+             "filter": {"user_id": 0, "deleted": False}, "sort": [("sent_at", DESCENDING)], "limit": 1},
+            {"name": "reminder cooldown", "collection": "reminders",
+             "filter": {"user_id": 0, "sent_at": {"$gte": now}, "deleted": False}},
+            {"name": "reminders to delete", "collection": "reminders",
+             "filter": {"sent_at": {"$lt": now}, "responded": False, "deleted": False}},
+            {"name": "stat counter", "collection": "conversation_stats", "filter": {"key": "total_conversations"}},
+            {"name": "daily stat buckets", "collection": "stat_buckets",
+             "pipeline": [{"$match": {"kind": "conversations", "date": {"$gte": _day_start(now) - timedelta(days=29)}}},
+                          {"$group": {"_id": None, "count": {"$sum": "$count"}}}]},
+            {"name": "conversation summary", "collection": "conversation_summaries", "filter": {"user_id": 0}}
+        ]
+
+    async def explain_hot_queries(self) -> List[dict]:
+        """Run explain() on every hot query and report the plan stages, flagging collection scans and in-memory sorts"""
+        report = []
+        for query in self._hot_queries():
+            try:
+                if "pipeline" in query:
+                    explained = await self.db.command(
+                        "explain", {"aggregate": query["collection"], "pipeline": query["pipeline"], "cursor": {}},
+                        verbosity="queryPlanner"
+                    )
+                    # Older servers nest the planner under the first $cursor stage
+                    planner = explained.get("queryPlanner") or explained["stages"][0]["$cursor"]["queryPlanner"]
+                else:
+                    cursor = self.db[query["collection"]].find(query["filter"])
+                    if "sort" in query:
+                        cursor = cursor.sort(query["sort"])
+                    if "limit" in query:
+                        cursor = cursor.limit(query["limit"])
+                    planner = (await cursor.explain())["queryPlanner"]
+                stages = _plan_stages(planner["winningPlan"])
+                report.append({"name": query["name"], "collection": query["collection"],
+                               "stages": stages, "collscan": "COLLSCAN" in stages, "sort": "SORT" in stages})
+            except Exception as e:
+                logger.error(f"Error explaining query '{query['name']}': {e}")
+                report.append({"name": query["name"], "collection": query["collection"],
+                               "stages": [], "collscan": False, "sort": False, "error": str(e)})
+        return report
+
+    async def add_user(self, user_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None):
         try:
             user_data = {
                 "user_id": user_id,
@@ -31,7 +558,7 @@ class BotDatabase:
                 "last_activity": datetime.now(),
                 "preferences": {} 
             }
-            self.users_collection.update_one(
+            await self.users_collection.update_one(
                 {"user_id": user_id},
                 {"$setOnInsert": user_data},
                 upsert=True
@@ -41,70 +568,134 @@ class BotDatabase:
             logger.error(f"Error adding user: {e}")
             return False
 
-    def update_preferences(self, user_id: int, preferences: dict):
+    async def _load_user_state(self, user_id: int) -> Optional[dict]:
+        """Read the per-message user fields in one query and cache them"""
+        user = await self.users_collection.find_one(
+            {"user_id": user_id}, {"_id": 0, "is_verified": 1, "preferences": 1, "history_cleared_at": 1}
+        )
+        user = user or {}
+        user_state.set(
+            user_id,
+            verified=bool(user.get("is_verified", False)),
+            preferences=user.get("preferences", {}),
+            history_cleared_at=user.get("history_cleared_at")
+        )
+        return user
+
+    async def update_preferences(self, user_id: int, preferences: dict):
         try:
-            self.users_collection.update_one(
+            await self.users_collection.update_one(
                 {"user_id": user_id},
                 {"$set": {"preferences": preferences}}
             )
+            user_state.set(user_id, preferences=dict(preferences))
             return True
         except Exception as e:
             logger.error(f"Error updating preferences: {e}")
             return False
 
-    def get_preferences(self, user_id: int) -> dict:
+    async def get_preferences(self, user_id: int) -> dict:
         try:
-            user = self.users_collection.find_one({"user_id": user_id})
-            return user.get("preferences", {}) if user else {}
+            preferences = user_state.get(user_id, "preferences")
+            if preferences is MISSING:
+                preferences = (await self._load_user_state(user_id)).get("preferences", {})
+            return dict(preferences)
         except Exception as e:
             logger.error(f"Error getting preferences: {e}")
             return {}
 
-    def verify_user(self, user_id: int):
+    async def verify_user(self, user_id: int):
         try:
-            self.users_collection.update_one(
+            await self.users_collection.update_one(
                 {"user_id": user_id},
                 {"$set": {"is_verified": True}}
             )
+            user_state.set(user_id, verified=True)
             return True
         except Exception as e:
             logger.error(f"Error verifying user: {e}")
             return False
 
-    def is_user_verified(self, user_id: int) -> bool:
+    async def is_user_verified(self, user_id: int) -> bool:
         try:
-            user = self.users_collection.find_one({"user_id": user_id})
-            return bool(user and user.get("is_verified", False))
+            verified = user_state.get(user_id, "verified")
+            if verified is MISSING:
+                verified = bool((await self._load_user_state(user_id)).get("is_verified", False))
+            return verified
         except Exception as e:
             logger.error(f"Error checking verification: {e}")
             return False
 
-    def get_all_users(self) -> List[int]:
+    async def get_all_users(self) -> List[int]:
         try:
-            users = self.users_collection.find({"is_verified": True})
-            return [user["user_id"] for user in users]
+            users = self.users_collection.find({"is_verified": True}, {"user_id": 1})
+            return [user["user_id"] async for user in users]
         except Exception as e:
             logger.error(f"Error getting users: {e}")
             return []
 
-    def get_active_users_7d(self) -> int:
+    async def count_verified_users(self) -> int:
         try:
-            seven_days_ago = datetime.now() - timedelta(days=7)
-            pipeline = [
-                {"$match": {"timestamp": {"$gte": seven_days_ago}}},
-                {"$group": {"_id": "$user_id"}},
-                {"$count": "active_users"}
-            ]
-            result = list(self.conversations_collection.aggregate(pipeline))
-            return result[0]["active_users"] if result else 0
+            return await self.users_collection.count_documents({"is_verified": True})
         except Exception as e:
-            logger.error(f"Error getting active users (7d): {e}")
+            logger.error(f"Error counting users: {e}")
             return 0
 
-    def get_new_users_24h(self) -> int:
+    async def get_active_user_counts(self, windows: dict, exact: bool = ACTIVE_USERS_EXACT) -> dict:
+        """
+        Distinct chatting users over trailing windows (in days, today included).
+        Merges the daily HyperLogLog sketches by default; exact mode groups the raw conversations for audits.
+        """
+        try:
+            today = _day_start(datetime.now())
+            starts = {name: today - timedelta(days=days - 1) for name, days in windows.items()}
+            if exact:
+                if write_behind.pending:
+                    await write_behind.flush()
+                pipeline = [
+                    {"$match": {"end": {"$gte": min(starts.values())}}},
+                    {"$group": {"_id": "$user_id", "last": {"$max": "$end"}}},
+                    {"$group": {"_id": None, **{
+                        name: {"$sum": {"$cond": [{"$gte": ["$last", start]}, 1, 0]}}
+                        for name, start in starts.items()
+                    }}}
+                ]
+                result = await self.conversation_buckets.aggregate(pipeline).to_list(length=None)
+                return {name: result[0][name] if result else 0 for name in windows}
+
+            sketches = await activity_sketches.load(self.db, min(starts.values()))
+            counts = {}
+            for name, start in starts.items():
+                merged = HyperLogLog(activity_sketches.precision)
+                for day, sketch in sketches.items():
+                    if day >= start:
+                        merged.merge(sketch)
+                counts[name] = merged.count()
+            return counts
+        except Exception as e:
+            logger.error(f"Error getting active user counts: {e}")
+            return {name: 0 for name in windows}
+
+    async def get_stats_snapshot(self) -> Optional[dict]:
+        """The dashboard snapshot kept up to date by the stats materializer"""
+        try:
+            return await self.stats_snapshots.find_one({"_id": "dashboard"})
+        except Exception as e:
+            logger.error(f"Error getting stats snapshot: {e}")
+            return None
+
+    async def save_stats_snapshot(self, snapshot: dict):
+        try:
+            await self.stats_snapshots.replace_one({"_id": "dashboard"}, snapshot, upsert=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving stats snapshot: {e}")
+            return False
+
+    async def get_new_users_24h(self) -> int:
         try:
             one_day_ago = datetime.now() - timedelta(hours=24)
-            return self.users_collection.count_documents({
+            return await self.users_collection.count_documents({
                 "is_verified": True,
                 "joined_at": {"$gte": one_day_ago}
             })
@@ -112,7 +703,7 @@ class BotDatabase:
             logger.error(f"Error getting new users (24h): {e}")
             return 0
 
-    def get_conversation_counts(self) -> dict:
+    async def get_conversation_counts(self) -> dict:
         try:
             now = datetime.now()
             one_day_ago = now - timedelta(hours=24)
@@ -120,6 +711,9 @@ class BotDatabase:
             thirty_days_ago = now - timedelta(days=30)
             
             pipeline = [
+                {"$match": {"end": {"$gte": thirty_days_ago}}},
+                {"$unwind": "$messages"},
+                {"$replaceRoot": {"newRoot": "$messages"}},
                 {"$match": {"timestamp": {"$gte": thirty_days_ago}}},
                 {"$group": {
                     "_id": None,
@@ -144,7 +738,7 @@ class BotDatabase:
                     "total_30d": {"$sum": 1}
                 }}
             ]
-            result = list(self.conversations_collection.aggregate(pipeline))
+            result = await self.conversation_buckets.aggregate(pipeline).to_list(length=None)
             counts = result[0] if result else {"total_24h": 0, "total_7d": 0, "total_30d": 0}
             return {
                 "24h": counts.get("total_24h", 0),
@@ -155,99 +749,213 @@ class BotDatabase:
             logger.error(f"Error getting conversation counts: {e}")
             return {"24h": 0, "7d": 0, "30d": 0}
 
-    def add_conversation(self, user_id: int, role: str, content: str):
+    async def add_conversation(self, user_id: int, role: str, content: str):
+        return await self.add_conversations(user_id, [(role, content)])
+
+    async def add_conversations(self, user_id: int, messages: List[Tuple[str, str]]):
+        """Queue several (role, content) messages for a user on the write-behind buffer"""
+        if not messages:
+            return True
         try:
-            conversation_data = {
-                "user_id": user_id,
-                "role": role,
-                "content": content,
-                "timestamp": datetime.now()
-            }
-            self.conversations_collection.insert_one(conversation_data)
-            
-            # Increment persistent conversation stats
             now = datetime.now()
-            self.conversation_stats.update_one(
-                {"key": "total_conversations"},
-                {"$inc": {"total": 1}},
-                upsert=True
-            )
-            self.conversation_stats.update_one(
-                {"key": f"conv_{now.year}_{now.month}_{now.day}"},
-                {"$inc": {"count": 1}},
-                upsert=True
-            )
+            # Millisecond offsets keep the batch in order when sorting by timestamp; BSON dates drop microseconds
+            conversation_data = [
+                {
+                    "role": role,
+                    "content": content,
+                    "timestamp": now + timedelta(milliseconds=i)
+                }
+                for i, (role, content) in enumerate(messages)
+            ]
+            history_cache.append(user_id, [{"role": role, "content": content} for role, content in messages])
+            bucket_writer.add(user_id, conversation_data)
+
+            # Increment persistent conversation stats
+            await write_behind.increment("conversation_stats", {"key": "total_conversations"}, "total", len(messages))
+            await write_behind.increment("stat_buckets", {"kind": "conversations", "date": _day_start(now)}, "count", len(messages))
+            activity_sketches.add(_day_start(now), user_id)
             return True
         except Exception as e:
             logger.error(f"Error adding conversation: {e}")
             return False
 
-    def get_persistent_conversation_counts(self) -> dict:
+    async def get_persistent_conversation_counts(self) -> dict:
         try:
-            now = datetime.now()
-            one_day_ago = now - timedelta(hours=24)
-            seven_days_ago = now - timedelta(days=7)
-            thirty_days_ago = now - timedelta(days=30)
+            await write_behind.flush()
             
             # Total conversations
-            total_stats = self.conversation_stats.find_one({"key": "total_conversations"})
+            total_stats = await self.conversation_stats.find_one({"key": "total_conversations"})
             total = total_stats.get("total", 0) if total_stats else 0
             
-            # Time-based counts via aggregation on daily keys
-            pipeline_24h = [
-                {"$match": {"key": {"$regex": f"^conv_{now.year}_.*$"}}},
-                {"$project": {"date": {"$dateFromString": {"dateString": {"$substr": ["$key", 5, 10]}, "format": "%Y_%m_%d"}}}},
-                {"$match": {"date": {"$gte": one_day_ago}}},
-                {"$group": {"_id": None, "count": {"$sum": "$count"}}}
-            ]
-            result_24h = list(self.conversation_stats.aggregate(pipeline_24h))
-            count_24h = result_24h[0]["count"] if result_24h else 0
-            
-            pipeline_7d = [
-                {"$match": {"key": {"$regex": f"^conv_{now.year}_.*$"}}},
-                {"$project": {"date": {"$dateFromString": {"dateString": {"$substr": ["$key", 5, 10]}, "format": "%Y_%m_%d"}}}},
-                {"$match": {"date": {"$gte": seven_days_ago}}},
-                {"$group": {"_id": None, "count": {"$sum": "$count"}}}
-            ]
-            result_7d = list(self.conversation_stats.aggregate(pipeline_7d))
-            count_7d = result_7d[0]["count"] if result_7d else 0
-            
-            pipeline_30d = [
-                {"$match": {"key": {"$regex": f"^conv_{now.year}_.*$"}}},
-                {"$project": {"date": {"$dateFromString": {"dateString": {"$substr": ["$key", 5, 10]}, "format": "%Y_%m_%d"}}}},
-                {"$match": {"date": {"$gte": thirty_days_ago}}},
-                {"$group": {"_id": None, "count": {"$sum": "$count"}}}
-            ]
-            result_30d = list(self.conversation_stats.aggregate(pipeline_30d))
-            count_30d = result_30d[0]["count"] if result_30d else 0
+            # Every window from one range scan over the daily buckets
+            windows = await self._bucket_windows("conversations", {"24h": 1, "7d": 7, "30d": 30})
             
             return {
                 "total": total,
-                "24h": count_24h,
-                "7d": count_7d,
-                "30d": count_30d
+                "24h": windows["24h"],
+                "7d": windows["7d"],
+                "30d": windows["30d"]
             }
         except Exception as e:
             logger.error(f"Error getting persistent conversation counts: {e}")
             return {"total": 0, "24h": 0, "7d": 0, "30d": 0}
 
-    def get_conversation_history(self, user_id: int, limit: int = 10) -> List[dict]:
+    async def _bucket_windows(self, kind: str, windows: dict) -> dict:
+        """Sum a kind's daily buckets over several trailing windows (in days, today included) in one aggregation"""
+        today = _day_start(datetime.now())
+        starts = {name: today - timedelta(days=days - 1) for name, days in windows.items()}
+        pipeline = [
+            {"$match": {"kind": kind, "date": {"$gte": min(starts.values())}}},
+            {"$group": {"_id": None, **{
+                name: {"$sum": {"$cond": [{"$gte": ["$date", start]}, "$count", 0]}}
+                for name, start in starts.items()
+            }}}
+        ]
+        result = await self.stat_buckets.aggregate(pipeline).to_list(length=None)
+        return {name: result[0][name] if result else 0 for name in windows}
+
+    async def get_conversation_history(self, user_id: int, limit: int = CONVERSATION_HISTORY_LIMIT) -> List[dict]:
+        cached = history_cache.get(user_id, limit)
+        if cached is not None:
+            return cached
+        history = None
+        history_cache.begin_load(user_id)
         try:
-            conversations = self.conversations_collection.find({"user_id": user_id}).sort("timestamp", -1).limit(limit)
-            return [{"role": conv["role"], "content": conv["content"]} for conv in reversed(list(conversations))]
+            if bucket_writer.has_pending(user_id):
+                await write_behind.flush()
+            fetch = max(limit, history_cache.size)
+            cutoff = await self.get_history_cutoff(user_id)
+            
+            # The newest bucket almost always holds enough; the one before only matters right after a rollover
+            messages = []
+            buckets = self.conversation_buckets.find(
+                self._history_filter(user_id, cutoff), {"_id": 0, "messages": {"$slice": -fetch}}
+            ).sort("end", -1).batch_size(2)
+            async for bucket in buckets:
+                messages = [m for m in bucket["messages"] if not cutoff or m["timestamp"] >= cutoff] + messages
+                if len(messages) >= fetch:
+                    break
+            await buckets.close()
+            
+            messages.sort(key=lambda m: m["timestamp"])
+            history = [{"role": m["role"], "content": m["content"]} for m in messages[-fetch:]]
+            return history[-limit:] if limit > 0 else []
         except Exception as e:
             logger.error(f"Error getting history: {e}")
             return []
+        finally:
+            history_cache.end_load(user_id, history)
 
-    def clear_conversation(self, user_id: int):
+    async def get_all_conversations(self, user_id: int) -> List[dict]:
+        """Get a user's full stored conversation, oldest first"""
         try:
-            self.conversations_collection.delete_many({"user_id": user_id})
+            if bucket_writer.has_pending(user_id):
+                await write_behind.flush()
+            cutoff = await self.get_history_cutoff(user_id)
+            buckets = self.conversation_buckets.find(
+                self._history_filter(user_id, cutoff), {"_id": 0, "messages": 1}
+            ).sort("end", 1)
+            return [
+                {"role": m["role"], "content": m["content"]}
+                async for bucket in buckets for m in bucket["messages"]
+                if not cutoff or m["timestamp"] >= cutoff
+            ]
+        except Exception as e:
+            logger.error(f"Error getting full conversation: {e}")
+            return []
+
+    @staticmethod
+    def _history_filter(user_id: int, cutoff: Optional[datetime]) -> dict:
+        """Buckets still holding messages newer than the user's last clear"""
+        return {"user_id": user_id, "end": {"$gte": cutoff}} if cutoff else {"user_id": user_id}
+
+    async def get_history_cutoff(self, user_id: int) -> Optional[datetime]:
+        """When the user last cleared their history; older messages are hidden until reaped"""
+        cutoff = user_state.get(user_id, "history_cleared_at")
+        if cutoff is MISSING:
+            cutoff = (await self._load_user_state(user_id)).get("history_cleared_at")
+        return cutoff
+
+    async def clear_conversation(self, user_id: int):
+        """Hide the user's history by moving their cutoff; the history reaper deletes it later"""
+        try:
+            cutoff = datetime.now()
+            await self.users_collection.update_one(
+                {"user_id": user_id},
+                {"$set": {"history_cleared_at": cutoff, "history_reap_pending": True}}
+            )
+            user_state.set(user_id, history_cleared_at=cutoff)
+            history_cache.invalidate(user_id)
+            await self.conversation_summaries.delete_one({"user_id": user_id})
+            user_state.set(user_id, summary=None)
             return True
         except Exception as e:
             logger.error(f"Error clearing conversation: {e}")
             return False
 
-    def add_image_generation(self, user_id: int, category: str, image_type: str, success: bool = True):
+    async def get_users_to_reap(self, limit: int) -> List[dict]:
+        """Users whose cleared history has not been deleted yet"""
+        try:
+            users = self.users_collection.find(
+                {"history_reap_pending": True}, {"_id": 0, "user_id": 1, "history_cleared_at": 1}
+            )
+            return await users.to_list(length=limit)
+        except Exception as e:
+            logger.error(f"Error getting users to reap: {e}")
+            return []
+
+    async def reap_cleared_history(self, user_id: int, cutoff: datetime, batch_size: int) -> int:
+        """Delete one batch of buckets hidden by a clear; returns 0 once the user is fully reaped"""
+        buckets = self.conversation_buckets.find({"user_id": user_id, "end": {"$lt": cutoff}}, {"_id": 1})
+        ids = [bucket["_id"] for bucket in await buckets.to_list(length=batch_size)]
+        if ids:
+            result = await self.conversation_buckets.delete_many({"_id": {"$in": ids}, "end": {"$lt": cutoff}})
+            return max(result.deleted_count, 1)
+
+        # Buckets spanning the clear keep only their newer messages
+        await self.conversation_buckets.update_many(
+            {"user_id": user_id, "start": {"$lt": cutoff}},
+            [
+                {"$set": {"messages": {"$filter": {
+                    "input": "$messages", "cond": {"$gte": ["$$this.timestamp", cutoff]}
+                }}}},
+                {"$set": {"count": {"$size": "$messages"}, "start": {"$min": "$messages.timestamp"}}}
+            ]
+        )
+        # A newer clear keeps the user pending for its own pass
+        await self.users_collection.update_one(
+            {"user_id": user_id, "history_cleared_at": cutoff},
+            {"$unset": {"history_reap_pending": ""}}
+        )
+        return 0
+
+    async def get_conversation_summary(self, user_id: int) -> Optional[dict]:
+        """Get the rolling summary of turns that left the context window"""
+        try:
+            summary = user_state.get(user_id, "summary")
+            if summary is MISSING:
+                summary = await self.conversation_summaries.find_one({"user_id": user_id}, {"_id": 0})
+                user_state.set(user_id, summary=summary)
+            return summary
+        except Exception as e:
+            logger.error(f"Error getting conversation summary: {e}")
+            return None
+
+    async def update_conversation_summary(self, user_id: int, notes: List[str], folded: List[str]):
+        """Persist the rolling summary for a user"""
+        try:
+            await self.conversation_summaries.update_one(
+                {"user_id": user_id},
+                {"$set": {"notes": notes, "folded": folded, "updated_at": datetime.now()}},
+                upsert=True
+            )
+            user_state.set(user_id, summary={"user_id": user_id, "notes": notes, "folded": folded})
+            return True
+        except Exception as e:
+            logger.error(f"Error updating conversation summary: {e}")
+            return False
+
+    async def add_image_generation(self, user_id: int, category: str, image_type: str, success: bool = True):
         """Track image generation attempts"""
         try:
             image_data = {
@@ -257,87 +965,52 @@ class BotDatabase:
                 "success": success,
                 "timestamp": datetime.now()
             }
-            self.db["image_generations"].insert_one(image_data)
+            await write_behind.insert("image_generations", [image_data])
             
             # Update persistent image stats
             now = datetime.now()
-            self.conversation_stats.update_one(
-                {"key": "total_images"},
-                {"$inc": {"total": 1}},
-                upsert=True
-            )
+            await write_behind.increment("conversation_stats", {"key": "total_images"}, "total")
             
             # Track by type
-            self.conversation_stats.update_one(
-                {"key": f"images_{image_type}"},
-                {"$inc": {"count": 1}},
-                upsert=True
-            )
+            await write_behind.increment("conversation_stats", {"key": f"images_{image_type}"}, "count")
             
             # Track by category
-            self.conversation_stats.update_one(
-                {"key": f"category_{category}"},
-                {"$inc": {"count": 1}},
-                upsert=True
-            )
+            await write_behind.increment("conversation_stats", {"key": f"category_{category}"}, "count")
             
             # Daily tracking
-            self.conversation_stats.update_one(
-                {"key": f"img_{now.year}_{now.month}_{now.day}"},
-                {"$inc": {"count": 1}},
-                upsert=True
-            )
+            await write_behind.increment("stat_buckets", {"kind": "images", "date": _day_start(now)}, "count")
             
             return True
         except Exception as e:
             logger.error(f"Error adding image generation: {e}")
             return False
 
-    def get_image_generation_stats(self):
+    async def get_image_generation_stats(self):
         """Get comprehensive image generation statistics"""
         try:
-            now = datetime.now()
-            one_day_ago = now - timedelta(hours=24)
-            seven_days_ago = now - timedelta(days=7)
-            thirty_days_ago = now - timedelta(days=30)
+            await write_behind.flush()
             
             # Total images
-            total_stats = self.conversation_stats.find_one({"key": "total_images"})
+            total_stats = await self.conversation_stats.find_one({"key": "total_images"})
             total = total_stats.get("total", 0) if total_stats else 0
             
             # AI vs Static images
-            ai_stats = self.conversation_stats.find_one({"key": "images_ai_generated"})
-            static_stats = self.conversation_stats.find_one({"key": "images_static"})
+            ai_stats = await self.conversation_stats.find_one({"key": "images_ai_generated"})
+            static_stats = await self.conversation_stats.find_one({"key": "images_static"})
             
             ai_count = ai_stats.get("count", 0) if ai_stats else 0
             static_count = static_stats.get("count", 0) if static_stats else 0
             
-            # Time-based counts via aggregation
-            pipeline_24h = [
-                {"$match": {"key": {"$regex": f"^img_{now.year}_.*$"}}},
-                {"$project": {"date": {"$dateFromString": {"dateString": {"$substr": ["$key", 4, 10]}, "format": "%Y_%m_%d"}}}},
-                {"$match": {"date": {"$gte": one_day_ago}}},
-                {"$group": {"_id": None, "count": {"$sum": "$count"}}}
-            ]
-            result_24h = list(self.conversation_stats.aggregate(pipeline_24h))
-            count_24h = result_24h[0]["count"] if result_24h else 0
-            
-            pipeline_7d = [
-                {"$match": {"key": {"$regex": f"^img_{now.year}_.*$"}}},
-                {"$project": {"date": {"$dateFromString": {"dateString": {"$substr": ["$key", 4, 10]}, "format": "%Y_%m_%d"}}}},
-                {"$match": {"date": {"$gte": seven_days_ago}}},
-                {"$group": {"_id": None, "count": {"$sum": "$count"}}}
-            ]
-            result_7d = list(self.conversation_stats.aggregate(pipeline_7d))
-            count_7d = result_7d[0]["count"] if result_7d else 0
+            # Time-based counts from the daily buckets
+            windows = await self._bucket_windows("images", {"24h": 1, "7d": 7})
             
             # Get popular category
-            popular_category = self.get_popular_image_category()
+            popular_category = await self.get_popular_image_category()
             
             return {
                 'total': total,
-                '24h': count_24h,
-                '7d': count_7d,
+                '24h': windows['24h'],
+                '7d': windows['7d'],
                 'ai_generated': ai_count,
                 'static': static_count,
                 'popular_category': popular_category
@@ -346,7 +1019,7 @@ class BotDatabase:
             logger.error(f"Error getting image stats: {e}")
             return {'total': 0, '24h': 0, '7d': 0, 'ai_generated': 0, 'static': 0, 'popular_category': 'None'}
 
-    def get_popular_image_category(self):
+    async def get_popular_image_category(self):
         """Get the most popular image category"""
         try:
             # Get all category keys
@@ -355,7 +1028,7 @@ class BotDatabase:
             popular_category = "None"
             max_count = 0
             
-            for stat in category_stats:
+            async for stat in category_stats:
                 category_name = stat["key"].replace("category_", "")
                 count = stat.get("count", 0)
                 if count > max_count:
@@ -367,29 +1040,29 @@ class BotDatabase:
             logger.error(f"Error getting popular category: {e}")
             return "None"
 
-    def update_user_last_activity(self, user_id: int):
-        """Update user's last activity timestamp"""
+    async def update_user_last_activity(self, user_id: int):
+        """Update user's last activity timestamp (written by the write-behind buffer, at most once per interval)"""
         try:
-            self.users_collection.update_one(
-                {"user_id": user_id},
-                {"$set": {"last_activity": datetime.now()}},
-                upsert=True
-            )
+            last_activity.touch(user_id, datetime.now())
+            await write_behind.schedule()
             return True
         except Exception as e:
             logger.error(f"Error updating user activity: {e}")
             return False
 
-    def get_user_last_activity(self, user_id: int) -> Optional[datetime]:
+    async def get_user_last_activity(self, user_id: int) -> Optional[datetime]:
         """Get user's last activity timestamp"""
         try:
-            user = self.users_collection.find_one({"user_id": user_id})
+            pending = last_activity.latest(user_id)
+            if pending:
+                return pending
+            user = await self.users_collection.find_one({"user_id": user_id}, {"_id": 0, "last_activity": 1})
             return user.get("last_activity") if user and user.get("last_activity") else None
         except Exception as e:
             logger.error(f"Error getting user activity: {e}")
             return None
 
-    def add_reminder_sent(self, user_id: int, message_id: int, reminder_data: dict):
+    async def add_reminder_sent(self, user_id: int, message_id: int, reminder_data: dict):
         """Track sent reminders"""
         try:
             reminder_record = {
@@ -400,37 +1073,54 @@ class BotDatabase:
                 "responded": False,
                 "deleted": False
             }
-            self.db["reminders"].insert_one(reminder_record)
+            await self.db["reminders"].insert_one(reminder_record)
+            user_state.set(user_id, reminder=message_id)
             return True
         except Exception as e:
             logger.error(f"Error adding reminder: {e}")
             return False
 
-    def mark_reminder_responded(self, user_id: int, message_id: int):
+    @staticmethod
+    def _forget_pending_reminder(user_id: int, message_id: int):
+        if user_state.get(user_id, "reminder") == message_id:
+            user_state.set(user_id, reminder=None)
+
+    async def get_pending_reminder(self, user_id: int) -> Optional[int]:
+        """Message id of the user's latest reminder if it still awaits a reply; cached, since it is checked on every message"""
+        message_id = user_state.get(user_id, "reminder")
+        if message_id is MISSING:
+            reminder = await self.get_user_recent_reminder(user_id)
+            message_id = reminder["message_id"] if reminder and not reminder.get("responded", False) else None
+            user_state.set(user_id, reminder=message_id)
+        return message_id
+
+    async def mark_reminder_responded(self, user_id: int, message_id: int):
         """Mark reminder as responded to"""
         try:
-            self.db["reminders"].update_one(
+            await self.db["reminders"].update_one(
                 {"user_id": user_id, "message_id": message_id},
                 {"$set": {"responded": True, "responded_at": datetime.now()}}
             )
+            self._forget_pending_reminder(user_id, message_id)
             return True
         except Exception as e:
             logger.error(f"Error marking reminder responded: {e}")
             return False
 
-    def mark_reminder_deleted(self, user_id: int, message_id: int):
+    async def mark_reminder_deleted(self, user_id: int, message_id: int):
         """Mark reminder as deleted"""
         try:
-            self.db["reminders"].update_one(
+            await self.db["reminders"].update_one(
                 {"user_id": user_id, "message_id": message_id},
                 {"$set": {"deleted": True, "deleted_at": datetime.now()}}
             )
+            self._forget_pending_reminder(user_id, message_id)
             return True
         except Exception as e:
             logger.error(f"Error marking reminder deleted: {e}")
             return False
 
-    def get_pending_reminders_to_delete(self) -> List[dict]:
+    async def get_pending_reminders_to_delete(self) -> List[dict]:
         """Get reminders that need to be deleted (sent more than REMINDER_DELETE_AFTER seconds ago and not responded)"""
         try:
             from config import REMINDER_DELETE_AFTER
@@ -441,49 +1131,69 @@ class BotDatabase:
                 "responded": False,
                 "deleted": False
             })
-            return list(reminders)
+            return await reminders.to_list(length=None)
         except Exception as e:
             logger.error(f"Error getting reminders to delete: {e}")
             return []
 
 
-    def get_users_for_reminders(self, inactivity_threshold: int) -> List[dict]:
-        """Get users who are inactive and eligible for reminders"""
-        try:
-            from config import REMINDER_COOLDOWN
-            threshold_time = datetime.now() - timedelta(seconds=inactivity_threshold)
-            
-            # Get users who are verified and haven't been active since threshold
-            users = self.users_collection.find({
-                "is_verified": True,
-                "$or": [
-                    {"last_activity": {"$lt": threshold_time}},
-                    {"last_activity": {"$exists": False}}
-                ]
-            })
-            
-            user_list = []
-            for user in users:
-                # Check if user has received a reminder recently (within cooldown period)
-                cooldown_threshold = datetime.now() - timedelta(seconds=REMINDER_COOLDOWN)
-                recent_reminder = self.db["reminders"].find_one({
-                    "user_id": user["user_id"],
-                    "sent_at": {"$gte": cooldown_threshold},
-                    "deleted": False
-                })
-                
-                if not recent_reminder:
-                    user_list.append(user)
-            
-            return user_list
-        except Exception as e:
-            logger.error(f"Error getting users for reminders: {e}")
-            return []
+    async def iter_users_for_reminders(self, inactivity_threshold: int, batch_size: int = REMINDER_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+        """
+        Stream inactive verified users with no reminder inside the cooldown, in batches.
+        One server-side anti-join replaces a reminders lookup per user; only user_id and first_name are returned.
+        Each batch is its own short query resuming after the last user_id, so no cursor stays open while the
+        caller spends minutes sending reminders.
+        """
+        from config import REMINDER_COOLDOWN
+        now = datetime.now()
+        threshold_time = now - timedelta(seconds=inactivity_threshold)
+        cooldown_threshold = now - timedelta(seconds=REMINDER_COOLDOWN)
+        
+        match = {
+            "is_verified": True,
+            "$or": [
+                {"last_activity": {"$lt": threshold_time}},
+                {"last_activity": {"$exists": False}}
+            ]
+        }
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"user_id": 1}},
+            {"$project": {"_id": 0, "user_id": 1, "first_name": 1}},
+            # Served by the (user_id, deleted, sent_at) reminders index; one hit is enough to exclude the user
+            {"$lookup": {
+                "from": "reminders",
+                "localField": "user_id",
+                "foreignField": "user_id",
+                "pipeline": [
+                    {"$match": {"deleted": False, "sent_at": {"$gte": cooldown_threshold}}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "recent_reminders"
+            }},
+            {"$match": {"recent_reminders": {"$size": 0}}},
+            {"$project": {"user_id": 1, "first_name": 1}},
+            {"$limit": batch_size}
+        ]
+        
+        while True:
+            try:
+                batch = await self.users_collection.aggregate(pipeline).to_list(length=batch_size)
+            except Exception as e:
+                logger.error(f"Error getting users for reminders: {e}")
+                return
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            match["user_id"] = {"$gt": batch[-1]["user_id"]}
 
-    def get_user_recent_reminder(self, user_id: int) -> Optional[dict]:
+    async def get_user_recent_reminder(self, user_id: int) -> Optional[dict]:
         """Get user's most recent reminder that hasn't been deleted"""
         try:
-            reminder = self.db["reminders"].find_one({
+            reminder = await self.db["reminders"].find_one({
                 "user_id": user_id,
                 "deleted": False
             }, sort=[("sent_at", -1)])
@@ -492,3 +1202,6 @@ class BotDatabase:
         except Exception as e:
             logger.error(f"Error getting user recent reminder: {e}")
             return None
+
+# Global instance
+db = AsyncBotDatabase()
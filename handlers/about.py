@@ -1,14 +1,12 @@
 from pyrogram import Client, filters, enums
 from pyrogram.types import InputMediaPhoto
-from database import BotDatabase
+from database import db
 from utils.keyboard import build_about_keyboard, build_main_menu
 from config import BOT_NAME, BOT_USERNAME, OWNER_USERNAME, WELCOME_IMAGE, WELCOME_MESSAGE
 import logging
 
 logger = logging.getLogger(__name__)
 
-db = BotDatabase()
-
 # Single about page
 ABOUT_PAGE = """
 <blockquote>
@@ -32,7 +30,7 @@ async def about_callback(client: Client, callback_query):
     first_name = callback_query.from_user.first_name or "darling"
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await callback_query.answer("Please join the required channels first! 💖", show_alert=True)
         return
     
@@ -67,7 +65,7 @@ async def about_home_callback(client: Client, callback_query):
     first_name = callback_query.from_user.first_name or "darling"
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await callback_query.answer("Please join the required channels first! 💖", show_alert=True)
         return
     
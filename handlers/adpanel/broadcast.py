@@ -4,7 +4,7 @@ from pyrogram.errors import (
     UserIsBlocked, PeerIdInvalid, ChatWriteForbidden, 
     ChannelPrivate, FloodWait, RPCError
 )
-from database import BotDatabase
+from database import db
 from config import ADMIN_IDS
 from loguru import logger
 import asyncio
@@ -66,8 +66,7 @@ async def process_broadcast_confirmation(client: Client, message: Message):
             return
         
         # Get all users
-        db = BotDatabase()
-        users = db.get_all_users()
+        users = await db.get_all_users()
         if not users:
             await message.reply_text("❌ Nᴏ ᴜsᴇʀs ғᴏᴜɴᴅ ᴛᴏ ʙʀᴏᴀᴅᴄᴀsᴛ ᴛᴏ.")
             return
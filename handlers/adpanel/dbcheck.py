@@ -0,0 +1,48 @@
+import html
+from loguru import logger
+from pyrogram import Client, filters, enums
+from pyrogram.types import Message
+from database import db
+from config import ADMIN_IDS
+
+@Client.on_message(filters.command("dbcheck") & filters.private)
+async def dbcheck_command(client: Client, message: Message):
+    """Explain every hot query and flag the ones doing collection scans or in-memory sorts"""
+    user_id = message.from_user.id
+
+    # Check if user is an admin
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"Unauthorized /dbcheck attempt by user {user_id}")
+        await message.reply_text("🚫 Sorry, only admins can use this command!")
+        return
+
+    status = await message.reply_text("🔎 Explaining hot queries...")
+
+    # Make sure nothing is missing before judging the plans
+    await db.ensure_indexes()
+    report = await db.explain_hot_queries()
+
+    lines = []
+    for query in report:
+        if query.get("error"):
+            icon, plan = "⚠️", f"error: {html.escape(query['error'][:80])}"
+        else:
+            icon, plan = ("🔴" if query["collscan"] or query["sort"] else "🟢"), " → ".join(query["stages"])
+        lines.append(f"{icon} <b>{query['name']}</b> <code>{query['collection']}</code>\n    ↳ <code>{plan}</code>")
+
+    collscans = sum(1 for query in report if query["collscan"])
+    sorts = sum(1 for query in report if query["sort"])
+    summary = "\n".join(filter(None, [
+        f"🔴 <b>{collscans} of {len(report)} hot queries do a COLLSCAN</b>" if collscans else "",
+        f"🔴 <b>{sorts} of {len(report)} hot queries sort in memory</b>" if sorts else ""
+    ])) or f"✅ <b>All {len(report)} hot queries use an index</b>"
+
+    await status.edit_text(
+        "<blockquote><b>⍟───[ QUERY PLANS ]───⍟</b></blockquote>\n\n" + "\n".join(lines) + f"\n\n{summary}",
+        parse_mode=enums.ParseMode.HTML
+    )
+
+    if collscans or sorts:
+        logger.warning(f"⚠️ /dbcheck found {collscans} collection scans and {sorts} in-memory sorts on hot queries")
+    else:
+        logger.success("✅ /dbcheck: all hot queries are indexed")
@@ -3,11 +3,13 @@ from datetime import datetime, timedelta
 from loguru import logger
 from pyrogram import Client, filters, enums
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from database import BotDatabase
+from database import db
+from core.llm_scheduler import llm_scheduler
+from core.response_cache import response_cache
+from utils.write_behind import write_behind
+from utils.stats_materializer import stats_materializer
 from config import ADMIN_IDS, BOT_USERNAME, BOT_NAME
 
-db = BotDatabase()
-
 # Store stats data for navigation
 stats_cache = {}
 
@@ -72,16 +74,24 @@ async def get_comprehensive_stats():
     try:
         logger.info("📈 Gathering comprehensive statistics...")
         
+        # Read the materialized snapshot; only computed inline before its first refresh
+        snapshot = await db.get_stats_snapshot() or await stats_materializer.refresh()
+        
         # Get user statistics
-        total_users = len(db.get_all_users())
-        active_users_7d = db.get_active_users_7d()
-        new_users_24h = db.get_new_users_24h()
+        total_users = snapshot['total_users']
+        active_users_7d = snapshot['active_users_7d']
+        new_users_24h = snapshot['new_users_24h']
         
         # Get conversation statistics
-        conv_counts = db.get_persistent_conversation_counts()
+        conv_counts = snapshot['conversations']
         
         # Get image generation statistics - NOW WITH REAL DATA
-        image_stats = db.get_image_generation_stats()
+        image_stats = snapshot['images']
+        
+        # Get reply pipeline metrics
+        queue_metrics = llm_scheduler.get_metrics()
+        cache_metrics = response_cache.get_metrics()
+        write_metrics = write_behind.get_metrics()
         
         # Calculate growth rates
         active_rate_7d = (active_users_7d / total_users * 100) if total_users > 0 else 0
@@ -122,7 +132,19 @@ async def get_comprehensive_stats():
             'image_engagement_rate': image_engagement_rate,
             
             # Performance metrics
-            'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'llm_in_flight': queue_metrics['in_flight'],
+            'llm_queue_depth': queue_metrics['queue_depth'],
+            'llm_peak_queue_depth': queue_metrics['peak_queue_depth'],
+            'llm_avg_wait': queue_metrics['avg_wait'],
+            'llm_p95_wait': queue_metrics['p95_wait'],
+            'llm_shed': queue_metrics['shed'],
+            'cache_hit_rate': cache_metrics['hit_rate'],
+            'cache_hits': cache_metrics['hits'],
+            'cache_latency_saved': cache_metrics['latency_saved'],
+            'writes_pending': write_metrics['pending'],
+            'writes_buffered': write_metrics['writes_buffered'],
+            'write_round_trips': write_metrics['round_trips'],
+            'last_updated': snapshot['updated_at'].strftime('%Y-%m-%d %H:%M:%S'),
             'cache_timestamp': int(time.time())
         }
         
@@ -179,6 +201,15 @@ def format_overview_stats(stats_data):
 ├ • <b>Last 7d:</b> {stats_data['images_7d']:,}
 └ • <b>Popular Category:</b> {stats_data['popular_category']}</blockquote>
 
+<blockquote><b>⚡ Reply Pipeline:</b></blockquote>
+<blockquote>├ • <b>In Flight:</b> {stats_data['llm_in_flight']:,}
+├ • <b>Queue Depth:</b> {stats_data['llm_queue_depth']:,} (peak {stats_data['llm_peak_queue_depth']:,})
+├ • <b>Queue Wait:</b> avg {stats_data['llm_avg_wait']:.2f}s / p95 {stats_data['llm_p95_wait']:.2f}s
+├ • <b>Shed to Fallback:</b> {stats_data['llm_shed']:,}
+├ • <b>Cache Hit Rate:</b> {stats_data['cache_hit_rate']:.1f}% ({stats_data['cache_hits']:,} hits)
+├ • <b>Latency Saved:</b> {stats_data['cache_latency_saved']:.0f}s
+└ • <b>Buffered Writes:</b> {stats_data['writes_buffered']:,} in {stats_data['write_round_trips']:,} round trips ({stats_data['writes_pending']:,} pending)</blockquote>
+
 <blockquote>🔄 <b>Last Updated:</b> {stats_data['last_updated']}</blockquote>
 """
         
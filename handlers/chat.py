@@ -1,19 +1,36 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.enums import ChatAction
-from database import BotDatabase
+from pyrogram.errors import FloodWait
+from database import db
 from core.ai_client import VeniceAI
+from core.llm_scheduler import llm_scheduler
+from core.response_cache import response_cache
+from core.context_window import context_window
+from core.memory_index import memory_index
 from utils.keyboard import build_main_menu
 from utils.image_gallery import image_gallery
 from utils.reminder_system import reminder_system
-from config import BOT_USERNAME, WELCOME_IMAGE
+from utils.message_coalescer import message_coalescer
+from config import (
+    BOT_USERNAME,
+    CONVERSATION_HISTORY_LIMIT,
+    MEMORY_ENABLED,
+    MEMORY_TOP_K,
+    WELCOME_IMAGE,
+    OPENROUTER_STREAMING_ENABLED,
+    AI_RESPONSE_DEADLINE,
+    AI_FALLBACK_RESERVE,
+    STREAM_EDIT_INTERVAL,
+    STREAM_FIRST_CHUNK_MIN_CHARS
+)
 import logging
 import asyncio
 import re
+import time
 
 logger = logging.getLogger(__name__)
 
-db = BotDatabase()
 ai_client = VeniceAI()
 
 # Patterns to detect image requests
@@ -92,13 +109,80 @@ async def send_image_with_fallback(client: Message, image_url: str, caption: str
             logger.error(f"All image sending failed: {e2}")
             return False
 
+async def fold_summary(user_id: int, history: list, incoming: int):
+    """Fold whatever this turn pushes out of the history window into the rolling summary; incoming is how many messages it saves"""
+    summary_doc = await db.get_conversation_summary(user_id)
+    updated = context_window.fold(summary_doc, context_window.messages_to_fold(history, CONVERSATION_HISTORY_LIMIT, incoming))
+    if updated:
+        await db.update_conversation_summary(user_id, updated["notes"], updated["folded"])
+        summary_doc = updated
+    return summary_doc
+
+async def build_context(user_id: int, history: list, user_input: str, incoming: int) -> list:
+    """Pin the rolling summary and recalled old snippets ahead of the recent history"""
+    summary_doc = await fold_summary(user_id, history, incoming)
+    context = context_window.with_summary(history, context_window.render(summary_doc))
+    
+    if MEMORY_ENABLED:
+        await memory_index.ensure(user_id, lambda: db.get_all_conversations(user_id))
+        memories = memory_index.search(user_id, user_input, MEMORY_TOP_K, exclude=[m["content"] for m in history])
+        context = context_window.with_memories(context, memories)
+    return context
+
+async def save_turns(user_id: int, turns: list):
+    """Store the exchange and index it for long-term recall"""
+    await db.add_conversations(user_id, turns)
+    if MEMORY_ENABLED:
+        await memory_index.add(user_id, turns)
+
+async def send_streamed_reply(message: Message, stream) -> str:
+    """Send the first streamed chunk as a reply, then edit it as more text arrives"""
+    reply = None
+    text = ""
+    shown_text = ""
+    last_edit = 0.0
+    
+    async for text in stream:
+        now = time.monotonic()
+        if reply is None:
+            if len(text) < STREAM_FIRST_CHUNK_MIN_CHARS:
+                continue
+            reply = await message.reply_text(text)
+            shown_text, last_edit = text, now
+            continue
+        
+        # Throttle edits to stay inside Telegram's per-chat limits
+        if now - last_edit < STREAM_EDIT_INTERVAL or text == shown_text:
+            continue
+        try:
+            await reply.edit_text(text)
+            shown_text = text
+        except FloodWait as e:
+            logger.warning(f"Stream edit hit FloodWait, pausing edits for {e.value}s")
+            last_edit = now + int(e.value)
+            continue
+        except Exception as e:
+            logger.warning(f"Stream edit failed: {e}")
+        last_edit = now
+    
+    # Short replies never reach the first-chunk threshold, and the last tokens may still be pending
+    if reply is None:
+        await message.reply_text(text)
+    elif text != shown_text:
+        try:
+            await reply.edit_text(text)
+        except FloodWait as e:
+            await asyncio.sleep(int(e.value))
+            await reply.edit_text(text)
+    return text
+
 @Client.on_callback_query(filters.regex("chat_mila"))
 async def chat_callback(client: Client, callback_query):
     user_id = callback_query.from_user.id
     first_name = callback_query.from_user.first_name or "darling"
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await callback_query.answer("Please join the required channels first! 💖", show_alert=True)
         return
     
@@ -108,30 +192,41 @@ async def chat_callback(client: Client, callback_query):
         reply_markup=build_main_menu()
     )
 
-@Client.on_message(filters.text & filters.private & ~filters.command(["start", "clear", "profile", "menu", "broadcast", "stats", "policy"]))
+@Client.on_message(filters.text & filters.private & ~filters.command(["start", "clear", "profile", "menu", "broadcast", "stats", "policy", "dbcheck"]))
 async def chat_command(client: Client, message: Message):
     logger.debug(f"Processing chat message from user {message.from_user.id}: {message.text}")
     user_id = message.from_user.id
     first_name = message.from_user.first_name or "darling"
+    # The reply budget runs from arrival, so coalescing and queueing count against it
+    deadline = time.monotonic() + AI_RESPONSE_DEADLINE
 
     # Update user's last activity - ADD THIS LINE
-    db.update_user_last_activity(user_id)
+    await db.update_user_last_activity(user_id)
     
     # Handle reminder responses - ADD THIS LINE
     if reminder_system:
         await reminder_system.handle_user_response(user_id)
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await message.reply_text(
             "💕 Sweetie, please join the required channels first! Use /start to check. 😘",
             reply_markup=build_main_menu()
         )
         return
     
+    # Wait briefly for follow-up messages so a burst gets one combined reply
+    batch = await message_coalescer.collect(user_id, message)
+    if batch is None:
+        # Folded into the reply for an earlier message in the burst
+        return
+    message = batch[-1]
+    user_inputs = [m.text.replace(f"@{BOT_USERNAME}", "").strip() for m in batch]
+    user_turns = [("user", text) for text in user_inputs]
+    
     # Get user input and conversation history
-    user_input = message.text.replace(f"@{BOT_USERNAME}", "").strip()
-    history = db.get_conversation_history(user_id)
+    user_input = "\n".join(user_inputs)
+    history = await db.get_conversation_history(user_id)
     
     # Check if user is asking for an image
     if detect_image_request(user_input):
@@ -173,15 +268,14 @@ async def chat_command(client: Client, message: Message):
                 
                 # TRACK THE IMAGE GENERATION - ADD THIS LINE
                 image_type = "ai_generated" if "pollinations.ai" in image_url else "static"
-                db.add_image_generation(user_id, category or "general", image_type, success=True)
+                await db.add_image_generation(user_id, category or "general", image_type, success=True)
                 
                 # Save to conversation history
-                db.add_conversation(user_id, "user", user_input)
-                db.add_conversation(user_id, "assistant", f"[Created and sent a picture] {caption}")
+                await save_turns(user_id, user_turns + [("assistant", f"[Created and sent a picture] {caption}")])
                 return
             else:
                 # Track failed attempt
-                db.add_image_generation(user_id, category or "general", "failed", success=False)
+                await db.add_image_generation(user_id, category or "general", "failed", success=False)
                 raise Exception("All image sending methods failed")
             
         except Exception as e:
@@ -193,31 +287,70 @@ async def chat_command(client: Client, message: Message):
                 pass
             
             # Track failed attempt
-            db.add_image_generation(user_id, category or "general", "failed", success=False)
+            await db.add_image_generation(user_id, category or "general", "failed", success=False)
             
             # Fall back to cute text response
             fallback_response = "I tried to create a beautiful picture for you, sweetie, but my artistic skills are taking a break right now! 😔 How about I tell you how incredibly special you are instead? You mean the world to me! 💕✨"
             await message.reply_text(fallback_response)
             
             # Save to conversation history
-            db.add_conversation(user_id, "user", user_input)
-            db.add_conversation(user_id, "assistant", fallback_response)
+            await save_turns(user_id, user_turns + [("assistant", fallback_response)])
             return
     
     # Normal AI chat response
     try:
+        # Short greetings are answered from shared pools, so they never see this user's history
+        cacheable = response_cache.cacheable(user_input)
+        cached_response = response_cache.get(user_input, first_name) if cacheable else None
+        if cached_response:
+            await fold_summary(user_id, history, len(user_turns) + 1)
+            await save_turns(user_id, user_turns + [("assistant", cached_response)])
+            await message.reply_text(cached_response)
+            logger.info(f"AI responded to user {user_id} from cache: {cached_response[:50]}...")
+            return
+        
         # Send typing action
         await client.send_chat_action(chat_id=message.chat.id, action=ChatAction.TYPING)
+        started = time.monotonic()
+        if cacheable:
+            await fold_summary(user_id, history, len(user_turns) + 1)
+            context = []
+        else:
+            context = await build_context(user_id, history, user_input, len(user_turns) + 1)
         
-        # Generate AI response
-        response = ai_client.get_ai_response(history, user_input, first_name)
-        
-        # Save conversation
-        db.add_conversation(user_id, "user", user_input)
-        db.add_conversation(user_id, "assistant", response)
+        # Wait for an LLM slot; under overload the request is shed to an instant fallback
+        # Never queue into the time the provider chain and its fallback need
+        queue_budget = max(0.0, deadline - AI_FALLBACK_RESERVE - time.monotonic())
+        async with llm_scheduler.slot(user_id, queue_budget) as admitted:
+            shed = not admitted or time.monotonic() >= deadline
+            if shed:
+                response = ai_client.get_fallback_response()
+                
+                # Save conversation
+                await save_turns(user_id, user_turns + [("assistant", response)])
+                
+                await message.reply_text(response)
+            elif OPENROUTER_STREAMING_ENABLED:
+                # Stream the reply so the first words show up as soon as they are generated
+                response = await send_streamed_reply(
+                    message,
+                    ai_client.stream_ai_response(context, user_input, first_name, deadline)
+                )
+                
+                # Save conversation
+                await save_turns(user_id, user_turns + [("assistant", response)])
+            else:
+                # Generate AI response
+                response = await ai_client.get_ai_response(context, user_input, first_name, deadline)
+                
+                # Save conversation
+                await save_turns(user_id, user_turns + [("assistant", response)])
+                
+                # Send response without buttons
+                await message.reply_text(response)
         
-        # Send response without buttons
-        await message.reply_text(response)
+        if not shed and cacheable and not ai_client.is_fallback_response(response):
+            response_cache.put(user_input, response, time.monotonic() - started, first_name)
         logger.info(f"AI responded to user {user_id}: {response[:50]}...")
         
     except Exception as e:
@@ -231,7 +364,7 @@ async def menu_command(client: Client, message: Message):
     first_name = message.from_user.first_name or "darling"
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await message.reply_text(
             "💕 Sweetie, please join the required channels first! Use /start to check. 😘",
             reply_markup=build_main_menu()
@@ -1,27 +1,27 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from database import BotDatabase
+from database import db
+from core.memory_index import memory_index
 from utils.keyboard import build_main_menu
 import logging
 
 logger = logging.getLogger(__name__)
 
-db = BotDatabase()
-
 @Client.on_message(filters.command("clear") & filters.private)
 async def clear_command(client: Client, message: Message):
     user_id = message.from_user.id
     first_name = message.from_user.first_name or "darling"
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await message.reply_text(
             "💕 Sweetie, please join the required channels first! Use /start to check. 😘"
         )
         return
     
     # Clear conversation history
-    if db.clear_conversation(user_id):
+    if await db.clear_conversation(user_id):
+        await memory_index.forget(user_id)
         await message.reply_text(
             f"💖 All cleared, {first_name}! Our chat is fresh like a new day together. What's on your mind? 😘",
             reply_markup=build_main_menu()
@@ -38,12 +38,13 @@ async def clear_callback(client: Client, callback_query):
     first_name = callback_query.from_user.first_name or "darling"
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await callback_query.answer("Please join the required channels first! 💖", show_alert=True)
         return
     
     # Clear conversation history
-    if db.clear_conversation(user_id):
+    if await db.clear_conversation(user_id):
+        await memory_index.forget(user_id)
         await callback_query.message.edit_text(
             f"💖 All cleared, {first_name}! Our chat is fresh like a new day together. What's on your mind? 😘",
             reply_markup=build_main_menu()
@@ -1,15 +1,13 @@
 from pyrogram import Client, filters, enums
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors import UserNotParticipant
-from database import BotDatabase
+from database import db
 from utils.keyboard import build_main_menu
 from config import WELCOME_IMAGE, WELCOME_MESSAGE, REQUIRED_CHANNELS
 import logging
 
 logger = logging.getLogger(__name__)
 
-db = BotDatabase()
-
 async def is_user_member(client: Client, user_id: int) -> bool:
     """Check if user is member of all required channels."""
     for ch in REQUIRED_CHANNELS:
@@ -53,7 +51,7 @@ async def refresh_join_status(client: Client, callback_query):
     first_name = callback_query.from_user.first_name or "darling"
     
     if await is_user_member(client, user_id):
-        db.verify_user(user_id)
+        await db.verify_user(user_id)
         await callback_query.message.delete()
         try:
             await callback_query.message.reply_photo(
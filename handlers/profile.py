@@ -1,20 +1,18 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from database import BotDatabase
+from database import db
 from utils.keyboard import build_main_menu
 import logging
 
 logger = logging.getLogger(__name__)
 
-db = BotDatabase()
-
 @Client.on_message(filters.command("profile") & filters.private)
 async def profile_command(client: Client, message: Message):
     user_id = message.from_user.id
     first_name = message.from_user.first_name or "darling"
     
     # Check if user is verified
-    if not db.is_user_verified(user_id):
+    if not await db.is_user_verified(user_id):
         await message.reply_text(
             "💕 Sweetie, please join the required channels first! Use /start to check. 😘",
             reply_markup=build_main_menu()
@@ -22,7 +20,7 @@ async def profile_command(client: Client, message: Message):
         return
     
     # Get current preferences
-    preferences = db.get_preferences(user_id)
+    preferences = await db.get_preferences(user_id)
     current_nickname = preferences.get("nickname", first_name)
     current_traits = preferences.get("traits", "flirty and caring")
     
@@ -36,7 +34,7 @@ async def profile_command(client: Client, message: Message):
     
     # Update preferences if provided
     if new_prefs:
-        if db.update_preferences(user_id, new_prefs):
+        if await db.update_preferences(user_id, new_prefs):
             await message.reply_text(
                 f"💖 Oh, {first_name}, you’ve updated our vibe! I’ll call you {new_prefs.get('nickname', current_nickname)} and be {new_prefs.get('traits', current_traits)}. Ready to chat, my love? 😘",
                 reply_markup=build_main_menu()
@@ -1,14 +1,12 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message, InputMediaPhoto
-from database import BotDatabase
+from database import db
 from utils.keyboard import build_main_menu
 from config import WELCOME_MESSAGE, WELCOME_IMAGE
 from handlers.force_join import ask_user_to_join, is_user_member
 from utils.imagen import send_notification
 from loguru import logger
 
-db = BotDatabase()
-
 @Client.on_message(filters.command("start") & filters.private)
 async def start_command(client: Client, message: Message):
     user_id = message.from_user.id
@@ -17,10 +15,10 @@ async def start_command(client: Client, message: Message):
     last_name = message.from_user.last_name
     
     # Add user to database
-    db.add_user(user_id, username, first_name, last_name)
+    await db.add_user(user_id, username, first_name, last_name)
 
     # Update user's last activity - ADD THIS LINE
-    db.update_user_last_activity(user_id)
+    await db.update_user_last_activity(user_id)
     
     # Check channel membership
     is_member = await is_user_member(client, user_id)
@@ -30,7 +28,7 @@ async def start_command(client: Client, message: Message):
         return
     
     # Mark user as verified
-    db.verify_user(user_id)
+    await db.verify_user(user_id)
     
     # Send welcome message with image
     try:
@@ -5,10 +5,16 @@ import signal
 import time
 from pyrogram import Client
 from pyrogram.errors import FloodWait
-from config import API_ID, API_HASH, BOT_TOKEN
+from config import API_ID, API_HASH, BOT_TOKEN, ARCHIVE_ENABLED
 from utils.keep_alive import start_keep_alive
 from utils.startup import send_restart_notification, cleanup_bot_state
 from utils.reminder_system import initialize_reminder_system, shutdown_reminder_system
+from core.ai_client import close_http_session
+from database import db
+from utils.migrations import run_migrations
+from utils.stats_materializer import stats_materializer
+from utils.archive import archiver
+from utils.history_reaper import history_reaper
 
 # Setup logging
 logging.basicConfig(
@@ -33,6 +39,13 @@ async def main():
         keep_alive_thread = threading.Thread(target=start_keep_alive, daemon=True)
         keep_alive_thread.start()
         
+        # Warm the shared connection pool and make sure every hot query has its index before traffic arrives
+        await db.connect()
+        await db.ensure_indexes()
+        await run_migrations(db.db)
+        if not ARCHIVE_ENABLED:
+            await db.ensure_retention_indexes()
+        
         # Start the bot
         await app.start()
         logger.info("✅ Bot started successfully")
@@ -44,6 +57,16 @@ async def main():
         await initialize_reminder_system(app)
         logger.info("⏰ Reminder system initialized")
         
+        # Keep the admin dashboard snapshot fresh in the background
+        await stats_materializer.start()
+        
+        # Delete histories hidden by /clear in the background
+        await history_reaper.start()
+        
+        # Move data past its retention window into the local archive
+        if ARCHIVE_ENABLED:
+            await archiver.start()
+        
         # Keep the bot running
         await asyncio.Event().wait()
         
@@ -54,6 +77,11 @@ async def main():
         # Cleanup when bot stops
         logger.info("🛑 Bot is shutting down...")
         await shutdown_reminder_system()
+        await stats_materializer.stop()
+        await archiver.stop()
+        await history_reaper.stop()
+        await db.close()
+        await close_http_session()
         cleanup_bot_state()
         logger.info("✅ Bot shutdown complete")
 
@@ -0,0 +1,148 @@
+import asyncio
+import gzip
+import io
+import os
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+from loguru import logger
+from bson import json_util
+from database import db, RETENTION
+from config import ARCHIVE_DIR, ARCHIVE_INTERVAL, ARCHIVE_BATCH_SIZE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# zstd when available; both formats decode appended frames/members as one stream
+EXTENSION = ".jsonl.zst" if zstandard else ".jsonl.gz"
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+def _compress(data: bytes) -> bytes:
+    if zstandard:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data)
+
+def _open_archive(path: str):
+    """Binary stream over every frame appended to an archive file"""
+    raw = open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raw.close()
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+    return gzip.GzipFile(fileobj=raw, mode="rb")
+
+def archive_files(collection: str, directory: str = ARCHIVE_DIR) -> List[str]:
+    """Archive files of a collection, oldest month first"""
+    folder = os.path.join(directory, collection)
+    if not os.path.isdir(folder):
+        return []
+    names = [name for name in os.listdir(folder) if name.endswith((".jsonl.zst", ".jsonl.gz"))]
+    return [os.path.join(folder, name) for name in sorted(names)]
+
+def iter_archive(collection: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 directory: str = ARCHIVE_DIR) -> Iterator[dict]:
+    """Stream archived documents of a collection one at a time, optionally limited to a date range"""
+    field = RETENTION[collection][0]
+    first_month = since.strftime("%Y-%m") if since else None
+    last_month = until.strftime("%Y-%m") if until else None
+    for path in archive_files(collection, directory):
+        month = os.path.basename(path).split(".", 1)[0]
+        if (first_month and month < first_month) or (last_month and month > last_month):
+            continue
+        with _open_archive(path) as stream:
+            for line in io.TextIOWrapper(stream, encoding="utf-8"):
+                if not line.strip():
+                    continue
+                doc = json_util.loads(line, json_options=JSON_OPTIONS)
+                moment = doc.get(field)
+                if (since and moment < since) or (until and moment >= until):
+                    continue
+                yield doc
+
+class Archiver:
+    """Moves documents past their retention window from MongoDB into monthly compressed JSONL files"""
+
+    def __init__(self, directory: str, interval: int, batch_size: int):
+        self.directory = directory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.is_running = False
+        self.task = None
+
+    async def start(self):
+        """Start the archive loop"""
+        self.is_running = True
+        self.task = asyncio.create_task(self._loop())
+        logger.info("🗄️ Archiver started")
+
+    async def stop(self):
+        """Stop the archive loop"""
+        self.is_running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("🗄️ Archiver stopped")
+
+    async def _loop(self):
+        while self.is_running:
+            try:
+                await self.run()
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"🗄️ Error archiving old data: {e}")
+                await asyncio.sleep(60)
+
+    async def run(self) -> dict:
+        """Archive every collection with a retention window; returns documents moved per collection"""
+        moved = {}
+        for collection, (field, days) in RETENTION.items():
+            if days > 0:
+                moved[collection] = await self.archive_collection(collection, field, datetime.now() - timedelta(days=days))
+            # Only now that the collection is drained may its TTL be created or shortened
+            await db.ensure_ttl(collection, field, days)
+        if any(moved.values()):
+            logger.info(f"🗄️ Archived {moved}")
+        return moved
+
+    async def archive_collection(self, collection: str, field: str, cutoff: datetime) -> int:
+        """Append documents older than the cutoff to their month's file, then delete them from MongoDB"""
+        moved = 0
+        query = {field: {"$lt": cutoff}}
+        while True:
+            batch = await db.db[collection].find(query).sort(field, 1).to_list(length=self.batch_size)
+            if not batch:
+                return moved
+
+            # Encoding, compression and fsync run in a worker thread so handlers keep being served
+            await asyncio.to_thread(self._write_batch, collection, field, batch)
+
+            # Written before deleting, so a crash in between only repeats a batch in the archive;
+            # the cutoff guard skips buckets that received new messages meanwhile
+            await db.db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}, **query})
+            moved += len(batch)
+
+    def _write_batch(self, collection: str, field: str, batch: List[dict]):
+        by_month = {}
+        for doc in batch:
+            by_month.setdefault(doc[field].strftime("%Y-%m"), []).append(doc)
+        for month, docs in by_month.items():
+            self._append(collection, month, docs)
+
+    def _append(self, collection: str, month: str, docs: List[dict]):
+        folder = os.path.join(self.directory, collection)
+        os.makedirs(folder, exist_ok=True)
+        lines = "".join(json_util.dumps(doc, json_options=JSON_OPTIONS) + "\n" for doc in docs)
+        with open(os.path.join(folder, month + EXTENSION), "ab") as f:
+            f.write(_compress(lines.encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+
+# Global instance
+archiver = Archiver(ARCHIVE_DIR, ARCHIVE_INTERVAL, ARCHIVE_BATCH_SIZE)
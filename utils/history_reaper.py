@@ -0,0 +1,56 @@
+import asyncio
+from loguru import logger
+from database import db
+from config import HISTORY_REAPER_INTERVAL, HISTORY_REAPER_BATCH_SIZE, HISTORY_REAPER_BATCH_DELAY
+
+class HistoryReaper:
+    """Deletes conversation history hidden by /clear in small, paced batches off the request path"""
+
+    def __init__(self, interval: int, batch_size: int, batch_delay: float):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.is_running = False
+        self.task = None
+
+    async def start(self):
+        """Start the reaper loop"""
+        self.is_running = True
+        self.task = asyncio.create_task(self._loop())
+        logger.info("🧹 History reaper started")
+
+    async def stop(self):
+        """Stop the reaper loop"""
+        self.is_running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("🧹 History reaper stopped")
+
+    async def _loop(self):
+        while self.is_running:
+            try:
+                await self.run()
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"🧹 Error reaping cleared history: {e}")
+                await asyncio.sleep(60)
+
+    async def run(self) -> int:
+        """Reap every user with a pending clear; returns the number of delete batches issued"""
+        batches = 0
+        for user in await db.get_users_to_reap(self.batch_size):
+            while await db.reap_cleared_history(user["user_id"], user["history_cleared_at"], self.batch_size):
+                batches += 1
+                await asyncio.sleep(self.batch_delay)
+        if batches:
+            logger.debug(f"🧹 Reaped cleared history in {batches} batches")
+        return batches
+
+# Global instance
+history_reaper = HistoryReaper(HISTORY_REAPER_INTERVAL, HISTORY_REAPER_BATCH_SIZE, HISTORY_REAPER_BATCH_DELAY)
@@ -0,0 +1,60 @@
+import hashlib
+import math
+
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+class HyperLogLog:
+    """Fixed-size distinct counter; relative standard error is 1.04 / sqrt(2 ** precision)"""
+
+    def __init__(self, precision: int = 14, registers: bytes = None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f"expected {self.m} registers, got {len(self.registers)}")
+
+    def add(self, value) -> bool:
+        """Add a value; returns True if the sketch changed"""
+        x = int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: "HyperLogLog"):
+        """Fold another sketch of the same precision into this one (union)"""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added"""
+        if self.m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+
+        # Small cardinalities are far more accurate with linear counting
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, precision: int, data: bytes) -> "HyperLogLog":
+        return cls(precision, data)
+
+def precision_for_error(error: float) -> int:
+    """Register count exponent needed for a target relative standard error"""
+    precision = math.ceil(math.log2((1.04 / error) ** 2))
+    return max(MIN_PRECISION, min(MAX_PRECISION, precision))
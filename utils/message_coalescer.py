@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from loguru import logger
+from config import CHAT_COALESCE_WINDOW, CHAT_COALESCE_MAX_WAIT, CHAT_COALESCE_MAX_MESSAGES
+
+class _Batch:
+    def __init__(self, item: Any):
+        self.items = [item]
+        self.updated = asyncio.Event()
+
+class MessageCoalescer:
+    """Debounce a user's rapid-fire messages into one batch that gets a single reply"""
+
+    def __init__(self, window: float, max_wait: float, max_messages: int):
+        self.window = window
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        self.pending: Dict[int, _Batch] = {}
+
+    async def collect(self, user_id: int, item: Any) -> Optional[List[Any]]:
+        """
+        Add a message to the user's open batch.
+        Returns the whole batch to the first caller once the user goes quiet,
+        and None to every caller whose message was folded into someone else's batch.
+        """
+        if self.window <= 0:
+            return [item]
+
+        batch = self.pending.get(user_id)
+        if batch is not None:
+            batch.items.append(item)
+            batch.updated.set()
+            return None
+
+        batch = _Batch(item)
+        self.pending[user_id] = batch
+        started = time.monotonic()
+        try:
+            while len(batch.items) < self.max_messages:
+                batch.updated.clear()
+                time_left = self.max_wait - (time.monotonic() - started)
+                if time_left <= 0:
+                    break
+                try:
+                    # Every new message restarts the quiet window
+                    await asyncio.wait_for(batch.updated.wait(), timeout=min(self.window, time_left))
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            self.pending.pop(user_id, None)
+
+        if len(batch.items) > 1:
+            logger.info(f"🧺 Coalesced {len(batch.items)} messages from user {user_id}")
+        return batch.items
+
+# Global instance
+message_coalescer = MessageCoalescer(CHAT_COALESCE_WINDOW, CHAT_COALESCE_MAX_WAIT, CHAT_COALESCE_MAX_MESSAGES)
@@ -0,0 +1,114 @@
+import asyncio
+import re
+from datetime import datetime
+from loguru import logger
+from pymongo import UpdateOne
+from config import CONVERSATION_BUCKET_SIZE
+
+# Legacy daily counters looked like conv_2026_10_18 / img_2026_1_5 in conversation_stats
+LEGACY_DAILY_KEY = re.compile(r"^(conv|img)_(\d{4})_(\d{1,2})_(\d{1,2})$")
+LEGACY_KINDS = {"conv": "conversations", "img": "images"}
+BATCH_SIZE = 500
+
+async def migrate_daily_stat_keys(db) -> int:
+    """Move legacy string-keyed daily counters into date-typed stat_buckets documents"""
+    migrated = 0
+    while True:
+        legacy = await db["conversation_stats"].find(
+            {"key": {"$regex": LEGACY_DAILY_KEY.pattern}}, {"key": 1, "count": 1}
+        ).to_list(length=BATCH_SIZE)
+        if not legacy:
+            return migrated
+
+        operations, migrated_ids = [], []
+        for doc in legacy:
+            match = LEGACY_DAILY_KEY.match(doc["key"])
+            if not match:
+                continue
+            prefix, year, month, day = match.groups()
+            operations.append(UpdateOne(
+                {"kind": LEGACY_KINDS[prefix], "date": datetime(int(year), int(month), int(day))},
+                {"$inc": {"count": doc.get("count", 0)}},
+                upsert=True
+            ))
+            migrated_ids.append(doc["_id"])
+
+        if not migrated_ids:
+            return migrated
+
+        # Delete each batch right after copying it, so a rerun only redoes the batch in flight
+        await db["stat_buckets"].bulk_write(operations, ordered=False)
+        await db["conversation_stats"].delete_many({"_id": {"$in": migrated_ids}})
+        migrated += len(migrated_ids)
+
+async def migrate_conversation_buckets(db) -> int:
+    """Regroup one-document-per-message conversations into bounded per-user bucket documents"""
+    migrated = 0
+    for user_id in await db["conversations"].distinct("user_id"):
+        # Buckets from an interrupted earlier attempt are rebuilt from scratch
+        await db["conversation_buckets"].delete_many({"user_id": user_id, "source": "migration"})
+        live_open = await db["conversation_buckets"].find_one({"user_id": user_id, "open": True}, {"_id": 1})
+
+        messages = await db["conversations"].find(
+            {"user_id": user_id}, {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", 1).to_list(length=None)
+        buckets = [
+            {
+                "user_id": user_id,
+                "open": False,
+                "count": len(chunk),
+                "start": chunk[0]["timestamp"],
+                "end": chunk[-1]["timestamp"],
+                "messages": chunk,
+                "source": "migration"
+            }
+            for chunk in (messages[i:i + CONVERSATION_BUCKET_SIZE] for i in range(0, len(messages), CONVERSATION_BUCKET_SIZE))
+        ]
+        if not buckets:
+            continue
+        # Keep appending to the last migrated bucket unless new writes already opened one
+        buckets[-1]["open"] = live_open is None
+
+        await db["conversation_buckets"].insert_many(buckets)
+        await db["conversations"].delete_many({"user_id": user_id, "timestamp": {"$lte": buckets[-1]["end"]}})
+        await db["conversation_buckets"].update_many({"user_id": user_id, "source": "migration"}, {"$unset": {"source": ""}})
+        migrated += len(messages)
+    return migrated
+
+async def drop_daily_active_users(db) -> int:
+    """Drop the per-day active user sets that activity_sketches replaced"""
+    count = await db["daily_active_users"].estimated_document_count()
+    await db.drop_collection("daily_active_users")
+    return count
+
+# Applied in order; each runs once and is recorded in the migrations collection
+MIGRATIONS = [
+    ("daily_stat_buckets", migrate_daily_stat_keys),
+    ("conversation_buckets", migrate_conversation_buckets),
+    ("drop_daily_active_users", drop_daily_active_users)
+]
+
+async def run_migrations(db):
+    """Apply any migrations that have not run against this database yet"""
+    for name, migration in MIGRATIONS:
+        if await db["migrations"].find_one({"_id": name}):
+            continue
+        try:
+            logger.info(f"🛠️ Running migration '{name}'...")
+            result = await migration(db)
+            await db["migrations"].insert_one({"_id": name, "applied_at": datetime.now(), "result": result})
+            logger.success(f"✅ Migration '{name}' applied ({result})")
+        except Exception as e:
+            logger.error(f"❌ Migration '{name}' failed, will retry on next start: {e}")
+            return
+
+async def _main():
+    from database import db
+    await db.connect()
+    await db.ensure_indexes()
+    await run_migrations(db.db)
+    await db.close()
+
+if __name__ == "__main__":
+    # Run ahead of a deploy with: python -m utils.migrations
+    asyncio.run(_main())
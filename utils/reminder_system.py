@@ -3,7 +3,7 @@ import random
 from datetime import datetime, timedelta
 from loguru import logger
 from pyrogram import Client
-from database import BotDatabase
+from database import db
 from config import (
     REMINDER_ENABLED, 
     REMINDER_CHECK_INTERVAL,
@@ -12,8 +12,6 @@ from config import (
     REMINDER_MESSAGES
 )
 
-db = BotDatabase()
-
 class ReminderSystem:
     def __init__(self, client: Client):
         self.client = client
@@ -58,18 +56,21 @@ class ReminderSystem:
         try:
             logger.info("⏰ Checking for inactive users...")
             
-            # Get users who are eligible for reminders
-            users = db.get_users_for_reminders(REMINDER_INACTIVITY_THRESHOLD)
-            
-            if not users:
+            # Stream eligible users in batches instead of loading them all at once
+            sent = 0
+            async for users in db.iter_users_for_reminders(REMINDER_INACTIVITY_THRESHOLD):
+                logger.info(f"⏰ Found a batch of {len(users)} users eligible for reminders")
+                
+                for user in users:
+                    await self._send_reminder_to_user(user)
+                    sent += 1
+                    await asyncio.sleep(2)  # Small delay between sends to avoid rate limits
+            
+            if not sent:
                 logger.info("⏰ No users need reminders right now")
                 return
-
-            logger.info(f"⏰ Found {len(users)} users eligible for reminders")
             
-            for user in users:
-                await self._send_reminder_to_user(user)
-                await asyncio.sleep(2)  # Small delay between sends to avoid rate limits
+            logger.info(f"⏰ Sent reminders to {sent} users")
             
             # Clean up old reminders
             await self._cleanup_old_reminders()
@@ -105,7 +106,7 @@ class ReminderSystem:
                 )
             
             # Track the sent reminder
-            db.add_reminder_sent(user_id, message.id, reminder_data)
+            await db.add_reminder_sent(user_id, message.id, reminder_data)
             logger.success(f"⏰ Reminder sent to user {user_id}")
             
         except Exception as e:
@@ -114,7 +115,7 @@ class ReminderSystem:
     async def _cleanup_old_reminders(self):
         """Delete old reminders that haven't been responded to"""
         try:
-            reminders_to_delete = db.get_pending_reminders_to_delete()
+            reminders_to_delete = await db.get_pending_reminders_to_delete()
             
             if not reminders_to_delete:
                 return
@@ -146,26 +147,26 @@ class ReminderSystem:
             )
             
             # Mark as deleted in database
-            db.mark_reminder_deleted(user_id, message_id)
+            await db.mark_reminder_deleted(user_id, message_id)
             logger.info(f"⏰ Deleted old reminder for user {user_id}")
             return True
             
         except Exception as e:
             logger.error(f"⏰ Failed to delete reminder for user {reminder['user_id']}: {e}")
             # Mark as deleted anyway to avoid repeated attempts
-            db.mark_reminder_deleted(reminder['user_id'], reminder['message_id'])
+            await db.mark_reminder_deleted(reminder['user_id'], reminder['message_id'])
             return False
 
     async def handle_user_response(self, user_id: int):
         """Handle when a user responds to a reminder"""
         try:
             # Update user's last activity
-            db.update_user_last_activity(user_id)
+            await db.update_user_last_activity(user_id)
             
             # Mark any pending reminders as responded
-            recent_reminder = db.get_user_recent_reminder(user_id)
-            if recent_reminder and not recent_reminder.get("responded", False):
-                db.mark_reminder_responded(user_id, recent_reminder["message_id"])
+            message_id = await db.get_pending_reminder(user_id)
+            if message_id:
+                await db.mark_reminder_responded(user_id, message_id)
                 logger.info(f"⏰ User {user_id} responded to reminder")
             
         except Exception as e:
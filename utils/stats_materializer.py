@@ -0,0 +1,66 @@
+import asyncio
+import time
+from datetime import datetime
+from loguru import logger
+from database import db
+from config import STATS_MATERIALIZE_INTERVAL
+
+class StatsMaterializer:
+    """Keeps the admin dashboard snapshot fresh in the background so /stats is a single document read"""
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self.is_running = False
+        self.task = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        """Start the refresh loop"""
+        self.is_running = True
+        self.task = asyncio.create_task(self._loop())
+        logger.info("📊 Stats materializer started")
+
+    async def stop(self):
+        """Stop the refresh loop"""
+        self.is_running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("📊 Stats materializer stopped")
+
+    async def _loop(self):
+        while self.is_running:
+            try:
+                await self.refresh()
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"📊 Error refreshing stats snapshot: {e}")
+                await asyncio.sleep(60)
+
+    async def refresh(self) -> dict:
+        """Recompute the snapshot from the daily buckets and counters, then store it"""
+        async with self.lock:
+            started = time.monotonic()
+            active_users = await db.get_active_user_counts({"24h": 1, "7d": 7, "30d": 30})
+            snapshot = {
+                "total_users": await db.count_verified_users(),
+                "new_users_24h": await db.get_new_users_24h(),
+                "active_users_24h": active_users["24h"],
+                "active_users_7d": active_users["7d"],
+                "active_users_30d": active_users["30d"],
+                "conversations": await db.get_persistent_conversation_counts(),
+                "images": await db.get_image_generation_stats(),
+                "updated_at": datetime.now(),
+                "refresh_seconds": time.monotonic() - started
+            }
+            await db.save_stats_snapshot(snapshot)
+            logger.debug(f"📊 Stats snapshot refreshed in {snapshot['refresh_seconds']:.2f}s")
+            return snapshot
+
+# Global instance
+stats_materializer = StatsMaterializer(STATS_MATERIALIZE_INTERVAL)
@@ -0,0 +1,152 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from config import WRITE_BEHIND_ENABLED, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_BATCH
+
+DUPLICATE_KEY = 11000
+
+class WriteBehindBuffer:
+    """Buffers inserts and pre-sums counter increments, flushing them with insert_many/bulk_write"""
+
+    def __init__(self, enabled: bool, flush_interval: float, max_batch: int):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.db = None
+        self.inserts: Dict[str, List[dict]] = defaultdict(list)
+        # (collection, upsert filter, field) -> pending increment
+        self.counters: Dict[Tuple[str, tuple, str], int] = defaultdict(int)
+        # Other buffers (with a pending count and flush(db)) flushed on the same schedule
+        self.flushables: List[Any] = []
+        self.lock = asyncio.Lock()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.size_flush: Optional[asyncio.Task] = None
+
+        self.flushes = 0
+        self.writes_buffered = 0
+        self.round_trips = 0
+
+    def bind(self, db):
+        """Attach the Mongo database the buffer writes to (first caller wins)"""
+        if self.db is None:
+            self.db = db
+
+    @property
+    def pending(self) -> int:
+        return (sum(len(docs) for docs in self.inserts.values()) + len(self.counters)
+                + sum(flushable.pending for flushable in self.flushables))
+
+    async def insert(self, collection: str, documents: List[dict]):
+        """Queue documents for insertion"""
+        self.inserts[collection].extend(documents)
+        self.writes_buffered += len(documents)
+        await self._after_enqueue()
+
+    async def increment(self, collection: str, match: dict, field: str, amount: int = 1):
+        """Queue a counter increment; increments to the same counter are summed before flushing"""
+        self.counters[(collection, tuple(sorted(match.items())), field)] += amount
+        self.writes_buffered += 1
+        await self._after_enqueue()
+
+    def register(self, flushable):
+        """Flush another buffer together with this one"""
+        self.flushables.append(flushable)
+
+    async def schedule(self):
+        """Make sure work queued directly on a registered buffer gets flushed"""
+        await self._after_enqueue()
+
+    async def _after_enqueue(self):
+        if not self.enabled:
+            await self.flush()
+            return
+
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+        if self.pending >= self.max_batch and (self.size_flush is None or self.size_flush.done()):
+            self.size_flush = asyncio.create_task(self.flush())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.pending:
+                await self.flush()
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        async with self.lock:
+            if not self.pending or self.db is None:
+                return
+
+            inserts, self.inserts = self.inserts, defaultdict(list)
+            counters, self.counters = self.counters, defaultdict(int)
+            self.flushes += 1
+
+            for collection, documents in inserts.items():
+                await self._flush_inserts(collection, documents)
+
+            by_collection: Dict[str, List[Tuple[tuple, int]]] = defaultdict(list)
+            for key, amount in counters.items():
+                by_collection[key[0]].append((key, amount))
+            for collection, increments in by_collection.items():
+                await self._flush_counters(collection, increments)
+
+            for flushable in self.flushables:
+                if flushable.pending:
+                    self.round_trips += await flushable.flush(self.db)
+
+    async def _flush_inserts(self, collection: str, documents: List[dict]):
+        try:
+            self.round_trips += 1
+            await self.db[collection].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Documents already written by an earlier attempt come back as duplicate keys
+            failed = [error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+            if failed:
+                logger.error(f"❌ {len(failed)} write-behind inserts into {collection} failed, will retry")
+                self.inserts[collection][:0] = [documents[i] for i in failed]
+        except Exception as e:
+            logger.error(f"❌ Write-behind insert into {collection} failed, will retry: {e}")
+            self.inserts[collection][:0] = documents
+
+    async def _flush_counters(self, collection: str, increments: List[Tuple[tuple, int]]):
+        operations = [
+            UpdateOne(dict(match), {"$inc": {field: amount}}, upsert=True)
+            for (_, match, field), amount in increments
+        ]
+        try:
+            self.round_trips += 1
+            await self.db[collection].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Increments are not idempotent, so requeue only the ones the server reports as failed
+            failed = [error["index"] for error in e.details.get("writeErrors", [])]
+            logger.error(f"❌ {len(failed)} write-behind counter updates on {collection} failed, will retry")
+            for i in failed:
+                key, amount = increments[i]
+                self.counters[key] += amount
+        except Exception as e:
+            logger.error(f"❌ Write-behind counter flush to {collection} failed, will retry: {e}")
+            for key, amount in increments:
+                self.counters[key] += amount
+
+    async def stop(self):
+        """Cancel the timer and flush what is left"""
+        if self.flush_task:
+            self.flush_task.cancel()
+        await self.flush()
+        logger.info(f"💾 Write-behind buffer flushed ({self.writes_buffered} writes in {self.round_trips} round trips)")
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": self.pending,
+            "flushes": self.flushes,
+            "writes_buffered": self.writes_buffered,
+            "round_trips": self.round_trips
+        }
+
+# Global instance
+write_behind = WriteBehindBuffer(WRITE_BEHIND_ENABLED, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_BATCH)